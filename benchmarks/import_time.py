@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Cold start of the app: importing pm_app, create_app() and the first request, each run in a
+fresh interpreter so nothing is cached in sys.modules.
+
+  python benchmarks/import_time.py --runs 10 --modules 15
+
+--modules lists the slowest imports of one run, as reported by python -X importtime
+(cumulative microseconds, including the modules they import).
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ('import pm_app', 'create_app()', 'first request')
+
+
+def run_once():
+    sys.path.insert(0, ROOT)
+    timings = []
+    start = time.perf_counter()
+    import pm_app
+    timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    app = pm_app.create_app()
+    timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    response = app.test_client().get('/login')
+    timings.append(time.perf_counter() - start)
+    assert response.status_code == 200, response.status_code
+
+    print(' '.join(f'{timing:.6f}' for timing in timings))
+
+def slowest_imports(env, count):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import pm_app; pm_app.create_app()'],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters started')
+    parser.add_argument('--modules', type=int, default=0, help='show the slowest N imports')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_once()
+
+    # No background threads and no cached pages, only the startup itself is measured
+    env = dict(os.environ, MAIL_WORKERS='0', RESPONSE_CACHE='none')
+    runs = []
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, '-W', 'ignore', __file__, '--run'],
+            env=env, capture_output=True, text=True, check=True,
+            )
+        runs.append([float(value) * 1000 for value in result.stdout.split()])
+
+    for stage, timings in zip(STAGES, zip(*runs)):
+        print(f'{stage:<14} median {statistics.median(timings):8.1f} ms | '
+              f'min {min(timings):8.1f} ms | max {max(timings):8.1f} ms')
+    totals = [sum(timings) for timings in runs]
+    print(f"{'total':<14} median {statistics.median(totals):8.1f} ms | "
+          f'min {min(totals):8.1f} ms | max {max(totals):8.1f} ms')
+
+    if args.modules:
+        print()
+        for cumulative, name in slowest_imports(env, args.modules):
+            print(f'{cumulative / 1000:8.1f} ms  {name}')
+
+if __name__ == '__main__':
+    main()
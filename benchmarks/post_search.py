@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Latency of the forum search (pm_app.search.search_posts) on synthetic posts.
+
+  python benchmarks/post_search.py --posts 1000000 --database /tmp/posts.db
+  python benchmarks/post_search.py --posts 100000 --json search.json
+
+The posts are generated with pm_app.synthetic, whose words follow Zipf's law, in a temporary
+directory or once into --database and reused by later runs. The search terms are picked from
+the index by the number of posts they occur in, from rare to common, and every term is
+searched for its first page and for the page after --pages pages. For comparison a LIKE scan
+for the newest posts containing the term is timed once per term.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Shares of the posts a searched term occurs in
+TERM_SHARES = (0.0001, 0.001, 0.01, 0.05, 0.2)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def make_app(args):
+    sys.path.insert(0, ROOT)
+    from pm_app import create_app
+    from pm_app.config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(args.database)}'
+        MAIL_WORKERS = 0
+
+    return create_app(BenchmarkConfig)
+
+def prepare(app, args):
+    from pm_app import db
+    from pm_app.migrations import upgrade
+    from pm_app.models import seed_database
+    from pm_app.rollups import fill_rollups
+    from pm_app.synthetic import generate, SyntheticDataError
+
+    with app.app_context():
+        db.create_all()
+        upgrade()
+        fill_rollups()
+        seed_database()
+        start = time.perf_counter()
+        try:
+            generate(users=200, projects=1, units=1, tasks=1, entries=0, posts=args.posts, seed=args.seed,
+                     progress=lambda table, count: print(f'  {count:>9,} {table}', file=sys.stderr))
+        except SyntheticDataError as error:
+            print(f'Using the existing posts in {args.database} ({error})', file=sys.stderr)
+        else:
+            print(f'Generated {args.posts:,} posts in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+# (term, number of posts) closest to every share of TERM_SHARES, from the vocabulary of the index
+def pick_terms(posts):
+    from sqlalchemy import text
+    from pm_app import db
+
+    db.session.execute(text(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS temp.post_search_terms USING fts5vocab(main, post_search, row)'))
+    terms = [row for row in db.session.execute(text('SELECT term, doc FROM temp.post_search_terms'))
+             if row[0].isalpha()]
+    picked = []
+    for share in TERM_SHARES:
+        term, count = min(terms, key=lambda row: abs(row[1] - share * posts))
+        picked.append((term, count))
+    return picked
+
+# The cursor of the page that starts after offset matches of term, None if it has fewer
+def cursor_after(term, offset):
+    from pm_app import db
+    from pm_app.search import post_search, match_expression, encode_search_cursor
+
+    row = (db.session
+           .query(post_search.c.rank, post_search.c.rowid)
+           .filter(post_search.c.post_search.match(match_expression(term, prefix=False)))
+           .order_by(post_search.c.rank, post_search.c.rowid)
+           .offset(offset - 1)
+           .limit(1)
+           .first()
+           )
+    return encode_search_cursor(*row) if row else None
+
+def timed(function, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, result
+
+def run(app, args):
+    from pm_app import db
+    from pm_app.models import Post
+    from pm_app.search import search_posts
+
+    results = []
+    with app.app_context():
+        posts = db.session.query(db.func.count(Post.id)).scalar()
+        print(f'{posts:,} posts', file=sys.stderr)
+        for term, count in pick_terms(posts):
+            # The cursor of the page after --pages pages
+            after = None
+            for _ in range(args.pages):
+                after = search_posts(term, after=after).next_cursor
+            first, _ = timed(lambda: search_posts(term), args.repeat)
+            deep, _ = timed(lambda: search_posts(term, after=after), args.repeat) if after else ([], None)
+            beyond_cursor = cursor_after(term, args.offset) if count > args.offset else None
+            beyond, page = (timed(lambda: search_posts(term, after=beyond_cursor), args.repeat)
+                            if beyond_cursor else ([], None))
+            assert page is None or page.items, f'no page after {args.offset} matches of {term!r}'
+            like, _ = timed(
+                lambda: (Post.query
+                         .filter(Post.content.like(f'%{term}%'))
+                         .order_by(Post.date_posted.desc(), Post.id.desc())
+                         .limit(6).all()),
+                1)
+            results.append(dict(
+                term = term,
+                posts = count,
+                first_p50_ms = round(statistics.median(first), 2),
+                first_p95_ms = round(percentile(first, 0.95), 2),
+                deep_p50_ms = round(statistics.median(deep), 2) if deep else None,
+                beyond_p50_ms = round(statistics.median(beyond), 2) if beyond else None,
+                like_ms = round(like[0], 2),
+                ))
+            result = results[-1]
+            deep_text = f"{result['deep_p50_ms']:8.2f} ms" if deep else '       - ms'
+            beyond_text = f"{result['beyond_p50_ms']:8.2f} ms" if beyond else '       - ms'
+            print(f"{term:<10} in {count:>8,} posts | first page p50 {result['first_p50_ms']:8.2f} ms "
+                  f"p95 {result['first_p95_ms']:8.2f} ms | page {args.pages + 1} p50 {deep_text} | "
+                  f"after {args.offset} p50 {beyond_text} | LIKE scan {result['like_ms']:9.2f} ms")
+    return posts, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--database', help='SQLite file to generate once and reuse, a temporary one by default')
+    parser.add_argument('--repeat', type=int, default=20, help='measured searches per term and page')
+    parser.add_argument('--pages', type=int, default=5, help='pages to skip for the deep page')
+    parser.add_argument('--offset', type=int, default=1000, help='matches to skip for the page beyond them')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.database:
+            args.database = os.path.join(directory, 'posts.db')
+        app = make_app(args)
+        prepare(app, args)
+        posts, results = run(app, args)
+
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump(dict(posts=posts, seed=args.seed, results=results), stream, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Latency and query count per route on synthetic data, through the Flask test client.
+
+  python benchmarks/routes.py --scale medium --requests 20
+  python benchmarks/routes.py --scale large --database /tmp/large.db --json large.json
+
+The database is generated with pm_app.synthetic (the same data for the same scale and seed)
+in a temporary directory, or once into --database and reused by later runs. The page cache
+is off unless --cache is given, so the numbers are those of a cache miss.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = dict(
+    small = dict(users=50, projects=20, units=500, entries=50000, posts=200),
+    medium = dict(users=200, projects=100, units=2000, entries=500000, posts=1000),
+    large = dict(users=500, projects=300, units=10000, entries=5000000, posts=5000),
+    )
+# Last day of the synthetic time entries, the calendar weeks are loaded from before it
+UNTIL = date(2025, 12, 31)
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def make_app(args):
+    sys.path.insert(0, ROOT)
+    from pm_app import create_app
+    from pm_app.config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(args.database)}'
+        RESPONSE_CACHE = 'memory' if args.cache else 'none'
+        MAIL_WORKERS = 0
+        WTF_CSRF_ENABLED = False
+
+    return create_app(BenchmarkConfig)
+
+def prepare(app, args):
+    from pm_app import db
+    from pm_app.migrations import upgrade
+    from pm_app.models import seed_database
+    from pm_app.rollups import fill_rollups
+    from pm_app.synthetic import generate, SyntheticDataError
+
+    with app.app_context():
+        db.create_all()
+        upgrade()
+        fill_rollups()
+        seed_database()
+        start = time.perf_counter()
+        try:
+            generate(**SCALES[args.scale], until=UNTIL, seed=args.seed,
+                     progress=lambda table, count: print(f'  {count:>9,} {table}', file=sys.stderr))
+        except SyntheticDataError as error:
+            print(f'Using the existing data in {args.database} ({error})', file=sys.stderr)
+        else:
+            print(f'Generated the {args.scale} data in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+# (name, method, url, form data) of every benchmarked request. The time entry wizard ends
+# with a POST that saves an entry, each request on another day, so it runs last.
+def benchmark_routes(app):
+    from pm_app.models import User, Project, Unit, WorkedFor
+    from pm_app.datetime_ import iso_week_label, week_monday
+
+    with app.app_context():
+        unit = Unit.query.join(Project).filter(Project.hov.like('SYN%'), Project.date_deactivation.is_(None)).first()
+        project = Project.query.get(unit.project_id)
+        username = User.query.filter(User.username.like('syn%')).first().username
+        week = iso_week_label(week_monday(UNTIL))
+        saved = iter(range(10 ** 6))
+        last_day = WorkedFor.query.order_by(WorkedFor.date_of_work.desc()).first().date_of_work.date()
+
+    def save_time_entry():
+        day = date.fromordinal(max(last_day, date(2100, 1, 1)).toordinal() + next(saved))
+        return dict(date_of_work=day.isoformat(), task='1', time_amount='1.0')
+
+    admin = '/admin/admin'
+    wizard = f'/new_time_entry/{project.hov}'
+    return [
+        ('about', 'GET', '/about', None),
+        ('forum', 'GET', '/home', None),
+        ('forum search', 'GET', '/search?q=kalo', None),
+        ("a user's posts", 'GET', f'/usr/{username}', None),
+        ('calendar', 'GET', '/calendar/', None),
+        ('calendar weeks', 'GET', f'/calendar/weeks?from={week}&count=4', None),
+        ('change time entry', 'GET', '/change_time_entry/', None),
+        ('time entry search', 'GET', f'/change_time_entry/search?project={project.id}', None),
+        ('admin', 'GET', '/admin/', None),
+        ('admin users', 'GET', f'{admin}/users/', None),
+        ('admin supervisors', 'GET', f'{admin}/supervisors/', None),
+        ('admin admins', 'GET', f'{admin}/admins/', None),
+        ('admin units', 'GET', f'{admin}/units/', None),
+        ('admin tasks', 'GET', f'{admin}/tasks/', None),
+        ('admin project status', 'GET', f'{admin}/show_project_status/', None),
+        ('unit autocomplete', 'GET', f'/units/search?q={str(unit.pn)[:4]}', None),
+        ('wizard: HoV', 'GET', '/new_time_entry', None),
+        ('wizard: unit', 'GET', wizard, None),
+        ('wizard: time', 'GET', f'{wizard}/{unit.pn}', None),
+        ('wizard: save', 'POST', f'{wizard}/{unit.pn}', save_time_entry),
+    ]
+
+def run(app, args):
+    from sqlalchemy import event
+    from pm_app import db
+
+    with app.app_context():
+        engine = db.engine
+    queries = [0]
+    def count_query(*_):
+        queries[0] += 1
+    event.listen(engine, 'before_cursor_execute', count_query)
+
+    client = app.test_client()
+    response = client.post('/login', data=dict(email='admin@admin.admin', password='password'))
+    assert response.status_code == 302, 'Logging in as admin failed'
+
+    results = []
+    for name, method, url, data in benchmark_routes(app):
+        latencies = []
+        counts = []
+        for number in range(args.warmup + args.requests):
+            queries[0] = 0
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=data() if callable(data) else data)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise SystemExit(f'{method} {url} failed with {response.status_code}')
+            if number >= args.warmup:
+                latencies.append(elapsed * 1000)
+                counts.append(queries[0])
+        results.append(dict(
+            route = name,
+            method = method,
+            url = url,
+            requests = len(latencies),
+            p50_ms = round(percentile(latencies, 0.5), 2),
+            p95_ms = round(percentile(latencies, 0.95), 2),
+            p99_ms = round(percentile(latencies, 0.99), 2),
+            max_ms = round(max(latencies), 2),
+            queries = statistics.median(counts),
+            max_queries = max(counts),
+            ))
+        result = results[-1]
+        print(f"{name:<22} p50 {result['p50_ms']:9.2f} ms | p95 {result['p95_ms']:9.2f} ms | "
+              f"p99 {result['p99_ms']:9.2f} ms | max {result['max_ms']:9.2f} ms | "
+              f"queries {result['queries']:6g} (max {result['max_queries']})")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--database', help='SQLite file to generate once and reuse, a temporary one by default')
+    parser.add_argument('--requests', type=int, default=20, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='unmeasured requests per route before')
+    parser.add_argument('--cache', action='store_true', help='use the in-memory page cache')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.database:
+            args.database = os.path.join(directory, 'bench.db')
+        app = make_app(args)
+        prepare(app, args)
+        results = run(app, args)
+
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump(dict(scale=args.scale, seed=args.seed, cache=args.cache, results=results), stream, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Readers against a long bulk write, with the production SQLite profile and with SQLite's defaults.
+
+  python benchmarks/sqlite_concurrency.py --rows 200000 --readers 4
+
+Every profile runs in its own process on a fresh database in a temporary directory: one
+thread inserts the rows in a single transaction (like the bulk import) while the reader
+threads keep loading a calendar week. With WAL the readers continue during the write,
+with the default rollback journal they wait for the lock or fail with 'database is locked'.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def run_profile(args):
+    sys.path.insert(0, ROOT)
+    from sqlalchemy.exc import OperationalError
+    from pm_app import create_app, db
+    from pm_app.models import User, Project, Unit, Task, WorkedFor
+    from pm_app.reports import entries_by_date
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        user = User.query.first() or User(username='bench', email='bench@bench.bench', password='x', supplier=0)
+        project = Project(hov='BENCH01', customer_name='Bench', budget=1e6)
+        task = Task(task_name='Bench', task_description='')
+        db.session.add_all([user, project, task])
+        db.session.flush()
+        units = [Unit(project_id=project.id, pn=f'BENCH-{n:03d}', pn_name=f'U{n}') for n in range(50)]
+        db.session.add_all(units)
+        db.session.commit()
+        user_id, task_id, unit_ids = user.id, task.id, [unit.id for unit in units]
+
+    writing = threading.Event()
+    done = threading.Event()
+    latencies = []
+    errors = []
+    write_time = []
+
+    def writer():
+        rows = [
+            dict(user_id=user_id, unit_id=unit_ids[n % len(unit_ids)], task_id=task_id, time_amount=1.0,
+                 date_of_work=datetime(2030, 1, 1) + timedelta(days=n // len(unit_ids)))
+            for n in range(args.rows)
+        ]
+        with app.app_context():
+            start = time.perf_counter()
+            with db.engine.begin() as connection:
+                writing.set()
+                for offset in range(0, len(rows), args.batch):
+                    connection.execute(WorkedFor.__table__.insert(), rows[offset:offset + args.batch])
+                    time.sleep(args.pause)
+            write_time.append(time.perf_counter() - start)
+        done.set()
+
+    def reader():
+        with app.app_context():
+            writing.wait()
+            while not done.is_set():
+                start = time.perf_counter()
+                try:
+                    entries_by_date(date(2029, 12, 30), date(2030, 1, 5))
+                    latencies.append(time.perf_counter() - start)
+                except OperationalError as error:
+                    errors.append(str(error.orig))
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(f"{os.environ['SQLITE_PROFILE']:<12} write {write_time[0]:6.2f}s | "
+          f"reads {len(ms):6d} | p50 {percentile(ms, 0.5):8.2f} ms | p95 {percentile(ms, 0.95):8.2f} ms | "
+          f"max {max(ms, default=0):8.2f} ms | errors {len(errors)}"
+          + (f" ({errors[0]})" if errors else ''))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help='rows inserted by the writer')
+    parser.add_argument('--batch', type=int, default=5000, help='rows per insert')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds between two inserts')
+    parser.add_argument('--readers', type=int, default=4, help='reader threads')
+    parser.add_argument('--profile', choices=['production', 'off', 'both'], default='both')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run_profile(args)
+
+    profiles = ['production', 'off'] if args.profile == 'both' else [args.profile]
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                SQLITE_PROFILE=profile,
+                RESPONSE_CACHE='none',
+                )
+            command = [sys.executable, '-W', 'ignore', __file__, '--run',
+                       '--rows', str(args.rows), '--batch', str(args.batch),
+                       '--pause', str(args.pause), '--readers', str(args.readers)]
+            subprocess.run(command, env=env, check=True)
+
+if __name__ == '__main__':
+    main()
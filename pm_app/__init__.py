@@ -1,27 +1,59 @@
-import os
-
-from sqlalchemy_schemadisplay import create_schema_graph
-from sqlalchemy import MetaData
-
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = '5791628bb0b13ce0c676dfde280ba245'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+from pm_app.config import Config
+from pm_app.database import SQLITE_PRAGMAS, engine_options, apply_sqlite_pragmas
+
+db = SQLAlchemy()
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
-app.config['MAIL_SERVER'] = 'smtp.googlemail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.environ.get('EMAIL_USER')
-app.config['MAIL_PASSWORD'] = os.environ.get('EMAIL_PASS')
-mail = Mail(app)
-
-from pm_app import routes
+mail = Mail()
+
+
+# Build the app. Nothing here touches the database: the schema is created and upgraded with
+# `flask create-db` / `flask db-upgrade` and the demo data is added with `flask seed-db`.
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+
+    if app.config['SQLITE_PROFILE'] != 'off':
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(
+            app.config['SQLALCHEMY_DATABASE_URI'],
+            pool_size=app.config['DB_POOL_SIZE'],
+            max_overflow=app.config['DB_MAX_OVERFLOW'],
+            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+            ))
+        apply_sqlite_pragmas(dict(SQLITE_PRAGMAS, busy_timeout=app.config['SQLITE_BUSY_TIMEOUT']))
+
+    db.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+    mail.init_app(app)
+
+    from pm_app import (
+        models, roles, rollups, versions, page_cache, reference, mailqueue, pictures, feed, commands,
+        instrumentation,
+        )
+    from pm_app.routes import main
+    from pm_app.api import api
+
+    models.init_app(app)
+    roles.init_app(app)
+    page_cache.init_app(app)
+    reference.init_app(app)
+    mailqueue.init_app(app)
+    pictures.init_app(app)
+    feed.init_app(app)
+    commands.init_app(app)
+    instrumentation.init_app(app)
+
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    app.register_blueprint(pictures.pictures)
+
+    return app
@@ -0,0 +1,95 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required
+
+from pm_app import db
+from pm_app.models import Project, Unit, ProjectRollup, UnitRollup
+from pm_app.reports import project_cost_overview, unit_hours
+from pm_app.roles import supervisor_required
+from pm_app.versions import conditional
+
+# Read-only JSON API for dashboards. Responses carry an ETag derived from the versions of the
+# tables they are built from, pollers sending If-None-Match get a 304 until the data changes.
+API_PREFIX = '/api/v1'
+
+api = Blueprint('api', __name__, url_prefix=API_PREFIX)
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+def _project(project):
+    return dict(
+        id = project.id,
+        hov = project.hov,
+        customer = project.customer_name,
+        budget = project.budget,
+        hour_budget = project.hour_budget,
+        rate = project.rate,
+        active = project.date_deactivation is None,
+        date_created = _date(project.date_created),
+        date_deactivation = _date(project.date_deactivation),
+        )
+
+# Cost overview of all projects with their units, the data of /about
+@api.route("/projects/costs")
+@login_required
+@supervisor_required
+@conditional(Project.__tablename__, Unit.__tablename__, ProjectRollup.__tablename__, UnitRollup.__tablename__)
+def api_project_costs():
+    overview = project_cost_overview()
+    return jsonify(
+        projects = [
+            dict(
+                _project(entry['project']),
+                hours = entry['hours'],
+                cost = entry['cost'],
+                ratio = entry['ratio'],
+                units = [
+                    dict(
+                        id = unit['unit'].id,
+                        pn = unit['unit'].pn,
+                        name = unit['unit'].pn_name,
+                        hours = unit['hours'],
+                        cost = unit['cost'],
+                        )
+                    for unit in entry['units']
+                ],
+                )
+            for entry in overview['projects']
+        ],
+        totals = overview['totals'],
+        )
+
+# Worked hours and cost of every unit
+@api.route("/units/hours")
+@login_required
+@supervisor_required
+@conditional(Project.__tablename__, Unit.__tablename__, UnitRollup.__tablename__)
+def api_unit_hours():
+    hovs = dict(db.session.query(Project.id, Project.hov))
+    return jsonify(
+        units = [
+            dict(
+                id = unit.id,
+                pn = unit.pn,
+                name = unit.pn_name,
+                project_id = unit.project_id,
+                hov = hovs.get(unit.project_id),
+                hours = hours,
+                cost = cost,
+                )
+            for unit, hours, cost in unit_hours()
+        ],
+        )
+
+# Active and deactivated projects, the data of show_project_status
+@api.route("/projects/status")
+@login_required
+@supervisor_required
+@conditional(Project.__tablename__)
+def api_project_status():
+    projects = Project.query.order_by(Project.id).all()
+    return jsonify(
+        active = [_project(project) for project in projects if not project.date_deactivation],
+        deactivated = [_project(project) for project in projects if project.date_deactivation],
+        )
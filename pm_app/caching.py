@@ -0,0 +1,177 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_MISSING = object()
+
+
+# Thread-safe in-process LRU cache whose entries expire ttl seconds after they were set.
+# Counts hits and misses so the effect of a cache can be checked under load.
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, value = item
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else None,
+            size=len(self._data),
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+        )
+
+
+# Cache that stores nothing, for RESPONSE_CACHE = 'none'
+class NullCache:
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key, default=None):
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        pass
+
+    def pop(self, key, default=None):
+        return default
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def stats(self):
+        return dict(hits=0, misses=self.misses, hit_ratio=0 if self.misses else None, size=0, maxsize=0, ttl=0)
+
+
+# Cache of text values in a SQLite file, shared by all worker processes on the host.
+# Same interface as TTLCache; entries expire ttl seconds after they were set and the oldest
+# ones are dropped beyond maxsize. Hits and misses are counted per process.
+class SQLiteCache:
+    def __init__(self, path, maxsize=1024, ttl=60, clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT NOT NULL PRIMARY KEY, '
+                'value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL)'
+                )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)')
+
+    # One short-lived connection per operation, committed (or rolled back) and closed afterwards
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        try:
+            with connection:
+                connection.execute('PRAGMA synchronous=NORMAL')
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key, default=None):
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, self.clock())
+                ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, value):
+        now = self.clock()
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, now + self.ttl),
+                )
+            connection.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,),
+                )
+
+    def pop(self, key, default=None):
+        with self._connect() as connection:
+            row = connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return default if row is None else row[0]
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM cache WHERE expires_at > ?', (self.clock(),)
+                ).fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else None,
+            size=len(self),
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+            path=self.path,
+        )
+
@@ -0,0 +1,167 @@
+import click
+from flask.cli import with_appcontext
+
+from pm_app import db
+from pm_app.migrations import upgrade, current_version, explain_hot_queries
+from pm_app.rollups import rebuild_rollups, fill_rollups
+from pm_app.models import Project, seed_database
+from pm_app.export import EXPORT_FORMATS, ExportError, export_query
+from pm_app.mailqueue import drain, purge, queue_stats
+from pm_app.synthetic import generate, SyntheticDataError
+from pm_app.importer import (
+    read_rows, import_time_entries, ImportFileError, IMPORT_BATCH_SIZE
+    )
+
+
+# flask rebuild-rollups: recompute the project/unit rollup tables from WorkedFor
+@click.command('rebuild-rollups')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not write.')
+@with_appcontext
+def rebuild_rollups_command(dry_run):
+    drift = rebuild_rollups(dry_run=dry_run)
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    for table, rollup_id, stored, actual in drift:
+        click.echo(f'{table} {rollup_id}: stored {stored} [h], actual {actual} [h]')
+    click.echo(f'{len(drift)} rollup row(s) drifted' + ('' if dry_run else ', tables rebuilt'))
+
+# flask create-db: create the missing tables, then bring the schema and the rollups up to date
+@click.command('create-db')
+@with_appcontext
+def create_db_command():
+    _upgrade()
+
+# flask db-upgrade: apply pending schema migrations to the configured database. Tables added
+# by later versions of the models (rollups, data versions, mail queue, ...) are created first,
+# the migrations only add indexes and search tables to them.
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    _upgrade()
+
+def _upgrade():
+    db.create_all()
+    click.echo('Created missing tables')
+    applied = upgrade()
+    for version in applied:
+        click.echo(f'Applied migration {version}')
+    click.echo(f'Database is at schema version {current_version()}')
+    if fill_rollups():
+        click.echo('Filled the rollup tables')
+
+# flask seed-db: add the demo projects, tasks and the admin user to an empty database
+@click.command('seed-db')
+@with_appcontext
+def seed_db_command():
+    seeded = seed_database()
+    click.echo('Seeded ' + ', '.join(seeded) if seeded else 'Nothing to seed, the tables are not empty')
+
+# flask explain-hot-queries: show the query plans of the hot queries, fails if one misses its index
+@click.command('explain-hot-queries')
+@with_appcontext
+def explain_hot_queries_command():
+    failed = 0
+    for name, index, plan, ok in explain_hot_queries():
+        click.echo(f"{'OK  ' if ok else 'FAIL'} {name} (expects {index})")
+        for detail in plan:
+            click.echo(f'       {detail}')
+        failed += not ok
+    if failed:
+        raise click.ClickException(f'{failed} hot query(s) do not use their index')
+
+# flask import-time-entries FILE: bulk import time entries from a CSV or Excel file
+@click.command('import-time-entries')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='Rows per insert.')
+@with_appcontext
+def import_time_entries_command(path, batch_size):
+    with open(path, 'rb') as stream:
+        try:
+            imported, errors = import_time_entries(read_rows(stream, path), batch_size=batch_size)
+        except ImportFileError as error:
+            raise click.ClickException(str(error))
+    for line, message in errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'{imported} time entries imported, {len(errors)} row(s) skipped')
+
+# flask export-time-entries OUTPUT: stream the time entries into a CSV or Parquet file
+@click.command('export-time-entries')
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'export_format', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), help='First day, YYYY-MM-DD.')
+@click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), help='Last day, YYYY-MM-DD.')
+@click.option('--project', 'hov', help='HoV of the project.')
+@with_appcontext
+def export_time_entries_command(output, export_format, date_from, date_to, hov):
+    project_id = None
+    if hov:
+        project = Project.query.filter_by(hov=hov).first()
+        if project is None:
+            raise click.ClickException(f'Unknown project {hov}')
+        project_id = project.id
+    query = export_query(
+        date_from.date() if date_from else None,
+        date_to.date() if date_to else None,
+        project_id,
+        )
+    try:
+        chunks = EXPORT_FORMATS[export_format][1](query)
+    except ExportError as error:
+        raise click.ClickException(str(error))
+    size = 0
+    with open(output, 'wb') as stream:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            stream.write(chunk)
+            size += len(chunk)
+    click.echo(f'Exported to {output} ({size:,} bytes)')
+
+# flask send-mail: send all queued mail that is due and delete the old sent and failed mails,
+# e.g. from cron with MAIL_WORKERS=0
+@click.command('send-mail')
+@with_appcontext
+def send_mail_command():
+    claimed = drain()
+    purged = purge()
+    stats = queue_stats()
+    click.echo(f'{claimed} mail(s) processed, {purged} old mail(s) deleted, queue: '
+               + ', '.join(f'{count} {status}' for status, count in sorted(stats.items())))
+
+# flask generate-data: add deterministic synthetic data at realistic volumes, e.g. for the benchmarks
+@click.command('generate-data')
+@click.option('--users', default=500, show_default=True)
+@click.option('--projects', default=300, show_default=True)
+@click.option('--units', default=10000, show_default=True)
+@click.option('--tasks', default=12, show_default=True)
+@click.option('--entries', default=5000000, show_default=True, help='Time entries.')
+@click.option('--posts', default=1000, show_default=True)
+@click.option('--years', default=4, show_default=True, help='Years of time entries.')
+@click.option('--seed', default=0, show_default=True, help='Same seed, same data.')
+@with_appcontext
+def generate_data_command(users, projects, units, tasks, entries, posts, years, seed):
+    try:
+        generate(
+            users=users, projects=projects, units=units, tasks=tasks, entries=entries,
+            posts=posts, years=years, seed=seed,
+            progress=lambda table, count: click.echo(f'{count:>9,} {table}'),
+            )
+    except SyntheticDataError as error:
+        raise click.ClickException(str(error))
+    click.echo('Synthetic data committed')
+
+def init_app(app):
+    for command in (
+        rebuild_rollups_command,
+        create_db_command,
+        db_upgrade_command,
+        seed_db_command,
+        explain_hot_queries_command,
+        import_time_entries_command,
+        export_time_entries_command,
+        send_mail_command,
+        generate_data_command,
+    ):
+        app.cli.add_command(command)
@@ -0,0 +1,72 @@
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+# Engine profile of the database. SQLite runs in WAL mode, so readers never block the writer
+# and the other way round, and a writer waits up to busy_timeout ms for the lock instead of
+# failing with 'database is locked'. Server databases only get the pool settings.
+SQLITE_PRAGMAS = dict(
+    journal_mode = 'WAL',
+    synchronous = 'NORMAL',     # safe with WAL, fsync only at checkpoints
+    busy_timeout = 15000,       # ms
+    cache_size = -65536,        # KiB, i.e. 64 MiB page cache per connection
+    mmap_size = 268435456,      # 256 MiB
+    temp_store = 'MEMORY',
+    )
+
+
+def is_sqlite(uri):
+    return make_url(uri).drivername.startswith('sqlite')
+
+# Escape character of LIKE patterns, pass it as escape=LIKE_ESCAPE with escape_like()
+LIKE_ESCAPE = '\\'
+
+# User input for a LIKE pattern with its wildcards (% and _) matched literally
+def escape_like(value):
+    return value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace('%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_')
+
+# Keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS) of a database URI.
+# SQLite files get a connection pool as well, so the pragmas and the page cache of a
+# connection are kept between requests instead of reconnecting every time.
+def engine_options(uri, pool_size=5, max_overflow=10, pool_timeout=30, busy_timeout=SQLITE_PRAGMAS['busy_timeout']):
+    if is_sqlite(uri):
+        if make_url(uri).database in (None, '', ':memory:'):
+            return {}
+        return dict(
+            poolclass = QueuePool,
+            pool_size = pool_size,
+            max_overflow = max_overflow,
+            pool_timeout = pool_timeout,
+            connect_args = dict(
+                timeout = busy_timeout / 1000,
+                check_same_thread = False,
+                ),
+            )
+    return dict(
+        pool_size = pool_size,
+        max_overflow = max_overflow,
+        pool_timeout = pool_timeout,
+        pool_recycle = 1800,
+        pool_pre_ping = True,
+        )
+
+# Set the pragmas on every new SQLite connection of any engine. The listener is only
+# registered once, calling this again (e.g. for another app) updates the pragmas.
+def apply_sqlite_pragmas(pragmas):
+    _pragmas.update(pragmas)
+    if not event.contains(Engine, 'connect', _set_sqlite_pragmas):
+        event.listen(Engine, 'connect', _set_sqlite_pragmas)
+
+# The pragmas set on every new SQLite connection, shared by all apps of the process
+_pragmas = {}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
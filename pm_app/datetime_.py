@@ -2,61 +2,108 @@
 
 import os
 import sys
-from datetime import datetime, timedelta, time
+from datetime import MAXYEAR, MINYEAR, date, datetime, timedelta
+from functools import lru_cache
 
-os.system('clear')
+# Years accepted in ISO week parameters. One year of margin on both sides keeps the weeks
+# around a parsed week, and the labels of the pages before and after it, within datetime's
+# range. The week grid of MAXYEAR itself is left out, its last week ends in the year after.
+ISO_WEEK_YEARS = range(MINYEAR + 1, MAXYEAR - 1)
 
-def year_data(year=None):
+WEEKDAYS = [
+    'Monday', 'Tuesday', 'Wednesday', 'Thursday',
+    'Friday', 'Saturday', 'Sunday',
+    ]
 
-    if year is None:
-        date = datetime.now()
-        year = date.strftime("%Y")
-
-    # Create placeholders boundary days of year 
-    day_one_obj = datetime(int(year), 1, 1)
-    day_last_obj = datetime(int(year), 12, 31)
-
-    # Create placeholder for the date of the day one's week
-    DayOneOfFirstDayWeek_obj = day_one_obj - timedelta(days = day_one_obj.weekday())
-
-    # Create placeholder for the date of the day last's week
-    DayLastOfLastDayWeek_obj = day_last_obj + timedelta(days = 6 - day_last_obj.weekday())
-
-    # Create a nested dictionary with the week of the year as key and the correponding dates and weekdays as values. 
-    calender = {
-        (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%d/%m/%Y"):
-        {
-            int(
-                (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%W")
-                )+1:
-            (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%A"),
-        }
-        for day in range(
-            0, (
-                DayLastOfLastDayWeek_obj - DayOneOfFirstDayWeek_obj).days + 1
-            )
-            }
-    print('-'*50,'\n',calender,'\n','-'*50)
+def date_label(day):
+    return f'{day.day:02d}/{day.month:02d}/{day.year}'
 
-    for keys in calender:
-        print(keys, calender[keys])
+# Number of ISO calendar weeks of a year (52 or 53), 28 December always lies in the last one
+def weeks_in_year(year):
+    return date(year, 12, 28).isocalendar()[1]
+
+# Returns the ISO week grid of a year as a tuple of (calendar week, days) with days being
+# the seven (date, 'dd/mm/YYYY') pairs from Monday to Sunday. The grid is immutable and
+# memoized per year, the calendar windows are sliced from it (see week_range).
+@lru_cache(maxsize=16)
+def iso_week_grid(year):
+    first_monday = date.fromisocalendar(year, 1, 1)
+    grid = []
+    for week in range(weeks_in_year(year)):
+        monday = first_monday + timedelta(weeks=week)
+        days = tuple(
+            (day, date_label(day))
+            for day in (monday + timedelta(days=n) for n in range(7))
+        )
+        grid.append((week + 1, days))
+    return tuple(grid)
+
+def current_year():
+    return date.today().year
+
+# 'YYYY-Www' label of the ISO week a day belongs to, e.g. '2026-W40'
+def iso_week_label(day):
+    year, week, _ = day.isocalendar()
+    return f'{year:04d}-W{week:02d}'
 
-    return calender
+# Monday of an ISO week given as 'YYYY-Www', raises ValueError for anything else
+def parse_iso_week(string):
+    year, sep, week = string.strip().upper().partition('-W')
+    if not sep or not year.isdigit() or not week.isdigit():
+        raise ValueError(f'Invalid ISO week {string!r}, expected YYYY-Www')
+    year, week = int(year), int(week)
+    if year not in ISO_WEEK_YEARS:
+        raise ValueError(f'Year {year} is out of range, expected {ISO_WEEK_YEARS.start} to {ISO_WEEK_YEARS.stop - 1}')
+    if not 1 <= week <= weeks_in_year(year):
+        raise ValueError(f'Week {week} does not exist in {year}')
+    return date.fromisocalendar(year, week, 1)
+
+def week_monday(day):
+    return day - timedelta(days=day.weekday())
+
+# Returns count consecutive weeks starting at the week of monday as (label, days) pairs,
+# days being the (date, 'dd/mm/YYYY') pairs from Monday to Sunday. The weeks are slices of
+# the memoized iso_week_grid of each year they fall in, so a window across New Year reads two grids.
+def week_range(monday, count):
+    year, week, _ = week_monday(monday).isocalendar()
+    weeks = []
+    while len(weeks) < count:
+        grid = iso_week_grid(year)[week - 1:week - 1 + count - len(weeks)]
+        weeks.extend((f'{year:04d}-W{cw:02d}', days) for cw, days in grid)
+        year, week = year + 1, 1
+    return weeks
+
+# Returns a dictionary as follows: key = date and values = {week number: weekday}
+def year_data(year=None):
+    if year is None:
+        year = current_year()
+    return {
+        label: {cw: WEEKDAYS[day.weekday()]}
+        for cw, days in iso_week_grid(int(year))
+        for day, label in days
+        }
 
 def convert_dt_obj(string):
-    parser = "%d/%m/%Y"
-    date = dict(
-        day = datetime.strptime(string,parser).strftime("%d"),
-        month = datetime.strptime(string,parser).strftime("%m"),
-        year = datetime.strptime(string,parser).strftime("%Y"),
-        date_obj = datetime.strptime(string,parser)
+    date_obj = datetime.strptime(string, "%d/%m/%Y")
+    return dict(
+        cw = date_obj.isocalendar()[1],
+        day = f'{date_obj.day:02d}',
+        month = f'{date_obj.month:02d}',
+        year = f'{date_obj.year}',
+        date = date_label(date_obj),
+        date_obj = date_obj,
     )
 
-    return date
+if __name__ == '__main__':
+    os.system('clear')
 
-year_data(sys.argv[1])
-print(convert_dt_obj(sys.argv[2])['day'])
-print(convert_dt_obj(sys.argv[2])['month'])
-print(convert_dt_obj(sys.argv[2])['year'])
-print(convert_dt_obj(sys.argv[2])['date_obj'])
+    calender = year_data(sys.argv[1])
+    print('-'*50,'\n',calender,'\n','-'*50)
+    for keys in calender:
+        print(keys, calender[keys])
 
+    converted = convert_dt_obj(sys.argv[2])
+    print(converted['day'])
+    print(converted['month'])
+    print(converted['year'])
+    print(converted['date_obj'])
@@ -0,0 +1,47 @@
+from sqlalchemy import or_
+
+from pm_app import db
+from pm_app.database import LIKE_ESCAPE, escape_like
+from pm_app.models import User, Admin, Supervisor
+
+# Users with their role flags for the admin pages, read with one joined query instead of
+# looking up the roles user by user
+DIRECTORY_PAGE_SIZE = 50
+DIRECTORY_ROLES = ('admin', 'supervisor')
+
+
+# (id, username, email, supplier, is_admin, is_supervisor) of every user, by username, optionally
+# only users whose username or email contains search and only users with (or without) a role
+def directory_query(search=None, role=None, without_role=None):
+    supervisors = db.session.query(Supervisor.user_id).distinct().subquery()
+    flags = dict(
+        admin = Admin.id,
+        supervisor = supervisors.c.user_id,
+        )
+    query = (db.session
+             .query(
+                 User.id,
+                 User.username,
+                 User.email,
+                 User.supplier,
+                 flags['admin'].isnot(None).label('is_admin'),
+                 flags['supervisor'].isnot(None).label('is_supervisor'),
+                 )
+             .outerjoin(Admin, Admin.user_id == User.id)
+             .outerjoin(supervisors, supervisors.c.user_id == User.id)
+             )
+    if search:
+        pattern = f'%{escape_like(search)}%'
+        query = query.filter(or_(User.username.like(pattern, escape=LIKE_ESCAPE), User.email.like(pattern, escape=LIKE_ESCAPE)))
+    for name in (role, without_role):
+        if name is not None and name not in DIRECTORY_ROLES:
+            raise ValueError(f'Unknown role {name!r}')
+    if role is not None:
+        query = query.filter(flags[role].isnot(None))
+    if without_role is not None:
+        query = query.filter(flags[without_role].is_(None))
+    return query.order_by(User.username)
+
+# One page of the directory, a flask_sqlalchemy Pagination of directory_query rows
+def user_directory(search=None, role=None, page=1, per_page=DIRECTORY_PAGE_SIZE):
+    return directory_query(search, role).paginate(page=page, per_page=per_page, error_out=False)
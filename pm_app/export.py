@@ -0,0 +1,161 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from pm_app import db
+from pm_app.models import User, Project, Unit, Task, WorkedFor
+
+# Columns of an export, in order
+EXPORT_COLUMNS = (
+    'user', 'hov', 'customer', 'pn', 'unit_name', 'task',
+    'hours', 'date', 'rate', 'cost',
+    )
+# Rows fetched from the database at once, also the size of a CSV chunk
+EXPORT_BATCH_SIZE = 1000
+# Rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+class ExportError(Exception):
+    pass
+
+# Joined time entries for the export, oldest first, optionally limited to a date range
+# (both included) and a project. Only plain columns are selected, no ORM objects.
+def export_query(date_from=None, date_to=None, project_id=None):
+    rate = func.coalesce(Project.rate, 0)
+    query = (db.session
+             .query(
+                 User.username,
+                 Project.hov,
+                 Project.customer_name,
+                 Unit.pn,
+                 Unit.pn_name,
+                 Task.task_name,
+                 WorkedFor.time_amount,
+                 WorkedFor.date_of_work,
+                 rate,
+                 WorkedFor.time_amount * rate,
+                 )
+             .join(User, User.id == WorkedFor.user_id)
+             .join(Unit, Unit.id == WorkedFor.unit_id)
+             .join(Project, Project.id == Unit.project_id)
+             .join(Task, Task.id == WorkedFor.task_id)
+             )
+    if date_from is not None:
+        query = query.filter(WorkedFor.date_of_work >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.filter(WorkedFor.date_of_work < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if project_id is not None:
+        query = query.filter(Unit.project_id == project_id)
+    return query.order_by(WorkedFor.id)
+
+# Rows of the query in lists of batch_size. The rows are fetched batch by batch with
+# yield_per, so only one batch is held in memory however large the export is.
+def iter_batches(query, batch_size=EXPORT_BATCH_SIZE):
+    batch = []
+    for row in query.yield_per(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# The export as CSV text, one chunk per batch, starting with the header
+def csv_chunks(query, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in iter_batches(query, batch_size):
+        for user, hov, customer, pn, unit_name, task, hours, day, rate, cost in batch:
+            writer.writerow((user, hov, customer, pn, unit_name, task, hours, day.date().isoformat(), rate, cost))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# File object collecting what pyarrow writes, drained after every row group
+class _ChunkSink:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+# The export as Parquet bytes, one chunk per row group. pyarrow is only needed for this
+# format and is imported before the first chunk, so a missing install fails up front.
+def parquet_chunks(query, row_group_size=PARQUET_ROW_GROUP_SIZE, batch_size=EXPORT_BATCH_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet exports require pyarrow (pip install pyarrow)')
+    return _parquet_chunks(pa, pq, query, row_group_size, batch_size)
+
+def _parquet_chunks(pa, pq, query, row_group_size, batch_size):
+    schema = pa.schema([
+        ('user', pa.string()),
+        ('hov', pa.string()),
+        ('customer', pa.string()),
+        ('pn', pa.string()),
+        ('unit_name', pa.string()),
+        ('task', pa.string()),
+        ('hours', pa.float64()),
+        ('date', pa.date32()),
+        ('rate', pa.float64()),
+        ('cost', pa.float64()),
+        ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+
+    def column(field, values):
+        if field.name == 'date':
+            values = [value.date() for value in values]
+        elif field.type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        return pa.array(values, type=field.type)
+
+    def write(rows):
+        writer.write_table(pa.Table.from_arrays(
+            [column(field, values) for field, values in zip(schema, zip(*rows))],
+            schema=schema,
+            ))
+
+    rows = []
+    for batch in iter_batches(query, batch_size):
+        rows += batch
+        if len(rows) >= row_group_size:
+            write(rows)
+            rows = []
+            yield sink.drain()
+    if rows:
+        write(rows)
+    writer.close()
+    yield sink.drain()
+
+EXPORT_FORMATS = dict(
+    csv = ('text/csv', csv_chunks),
+    parquet = ('application/vnd.apache.parquet', parquet_chunks),
+    )
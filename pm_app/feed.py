@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from pm_app import db
+from pm_app.caching import TTLCache
+from pm_app.models import Post
+from pm_app.versions import data_versions
+
+# Keyset (cursor) pagination of the forum posts on (date_posted, id), served by the indexes
+# ix_post_date_posted_id and ix_post_user_id_date_posted_id. A page reads at most
+# POSTS_PER_PAGE + 1 rows after its cursor, however deep it is, instead of counting all posts
+# and skipping the pages before it with OFFSET.
+POSTS_PER_PAGE = 5
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+# One page of posts with the cursors of the pages next to it (None at either end). The total
+# is only counted if a template shows it.
+class PostPage:
+    def __init__(self, items, next_cursor, previous_cursor, user_id=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.user_id = user_id
+
+    @property
+    def total(self):
+        return post_count(self.user_id)
+
+def encode_cursor(post):
+    return f'{post.date_posted.strftime(CURSOR_FORMAT)}-{post.id}'
+
+# Raises ValueError for a cursor that was not made by encode_cursor
+def decode_cursor(cursor):
+    stamp, post_id = cursor.split('-')
+    return datetime.strptime(stamp, CURSOR_FORMAT), int(post_id)
+
+# Number of posts (of one user), cached until the post table changes: the version of the
+# table is part of the key, so the count is exact without a COUNT(*) on every page
+def post_count(user_id=None):
+    cache = current_app.extensions['post_counts']
+    key = (user_id, data_versions([Post.__tablename__])[Post.__tablename__])
+    total = cache.get(key)
+    if total is None:
+        query = db.session.query(db.func.count(Post.id))
+        if user_id is not None:
+            query = query.filter(Post.user_id == user_id)
+        total = query.scalar()
+        cache.set(key, total)
+    return total
+
+# The page after the cursor after, or before the cursor before, of all posts or of one user's.
+# The authors are loaded in the same query.
+def post_page(user_id=None, after=None, before=None, newest_first=True, per_page=POSTS_PER_PAGE):
+    forward = before is None
+    cursor = decode_cursor(after if forward else before) if (after or before) else None
+
+    query = Post.query.options(joinedload(Post.author))
+    if user_id is not None:
+        query = query.filter(Post.user_id == user_id)
+    # Going back the rows are read in the reverse order of the feed, then turned around
+    descending = newest_first == forward
+    key = tuple_(Post.date_posted, Post.id)
+    if cursor is not None:
+        query = query.filter(key < tuple_(*cursor) if descending else key > tuple_(*cursor))
+    if descending:
+        query = query.order_by(Post.date_posted.desc(), Post.id.desc())
+    else:
+        query = query.order_by(Post.date_posted, Post.id)
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    items = rows[:per_page]
+    if not forward:
+        items.reverse()
+
+    if forward:
+        next_cursor = encode_cursor(items[-1]) if more else None
+        previous_cursor = encode_cursor(items[0]) if items and cursor is not None else None
+    else:
+        next_cursor = encode_cursor(items[-1]) if items else None
+        previous_cursor = encode_cursor(items[0]) if more else None
+    return PostPage(items, next_cursor, previous_cursor, user_id)
+
+def init_app(app):
+    app.extensions['post_counts'] = TTLCache(maxsize=1024, ttl=app.config['RESPONSE_CACHE_TTL'])
@@ -1,13 +1,14 @@
 
 from flask_wtf import FlaskForm
 from wtforms_sqlalchemy.fields import QuerySelectField
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from flask_login import current_user
 from wtforms.fields.html5 import DateField
 
 from wtforms import (
     StringField, PasswordField, SubmitField, BooleanField, 
-    TextAreaField, DecimalField,SelectField 
+    TextAreaField, DecimalField,SelectField, HiddenField,
+    Form, FieldList, FormField
     )
 
 from wtforms.validators import (
@@ -16,6 +17,19 @@ from wtforms.validators import (
 from pm_app.models import (
     User, Project, Unit, Task
     )
+from pm_app.reference import reference_data
+
+# Validator of the hidden unit fields filled by the unit autocomplete (_unit_picker.html)
+def known_unit(form, field):
+    if not field.data.isdigit() or int(field.data) not in reference_data().unit_by_id:
+        raise ValidationError('Please pick a unit from the search results.')
+
+# Validator of a picked unit that has to belong to an active project, use after known_unit
+def active_unit(form, field):
+    reference = reference_data()
+    unit = reference.unit_by_id.get(int(field.data)) if field.data.isdigit() else None
+    if unit is not None and reference.project_by_id[unit.project_id].date_deactivation:
+        raise ValidationError('The project of this unit is deactivated.')
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=20)])
@@ -120,7 +134,7 @@ class ModifyProject(FlaskForm):
     submit = SubmitField('Modify project now!')
 
 class FindUnit(FlaskForm):
-    units = SelectField('Units: ', validators=[DataRequired()])
+    units = HiddenField('Units: ', validators=[DataRequired('Please pick a unit.'), known_unit])
     submit = SubmitField('Modify unit now!')
 
 class CreateUnit(FlaskForm):
@@ -156,7 +170,7 @@ class GetHov(FlaskForm):
     submit = SubmitField('Next')
 
 class GetUnit(FlaskForm):
-    unit = SelectField('Unit: ', validators=[DataRequired()])
+    unit = HiddenField('Unit: ', validators=[DataRequired('Please pick a unit.'), known_unit])
     submit = SubmitField('Next')
 
 class GetTime(FlaskForm):
@@ -165,9 +179,25 @@ class GetTime(FlaskForm):
     time_amount = SelectField('Worked time [h]: ', validators=[DataRequired()])
     submit = SubmitField('Create new time entry now!')
 
-# Create a from to choose a time entry and decide if this entry is to be deleted
+# Weekly timesheet: every row is a unit/task pair with the hours from Monday to Friday
+TIMESHEET_ROWS = 8
+TIMESHEET_HOURS = [("", "-")] + [(str(i/10), i/10) for i in range(5,125,5)]
+
+class TimesheetRow(Form):
+    unit = HiddenField('Unit', validators=[Optional(), known_unit, active_unit])
+    task = SelectField('Task', validators=[Optional()])
+    hours = FieldList(
+        SelectField('Hours', choices=TIMESHEET_HOURS, validators=[Optional()]),
+        min_entries=5, max_entries=5)
+
+class WeeklyTimesheet(FlaskForm):
+    rows = FieldList(FormField(TimesheetRow), min_entries=TIMESHEET_ROWS, max_entries=TIMESHEET_ROWS)
+    submit = SubmitField('Save week')
+
+# Create a from to choose a time entry and decide if this entry is to be deleted,
+# the entry is picked with the search of /change_time_entry/search
 class ChangeTimeEntry(FlaskForm):
-    entries = SelectField('Select a time entry: ', validators=[DataRequired()])
+    entry_id = HiddenField('Selected time entry', validators=[DataRequired()])
     submit = SubmitField('Delete and update time entry now!')
 
 class AddSupervisor(FlaskForm):
@@ -195,7 +225,7 @@ class RemoveProject(FlaskForm):
     submit = SubmitField('Remove now!')
 
 class RemoveUnit(FlaskForm):
-    unit = SelectField('Unit to be removed', validators=[DataRequired()])
+    unit = HiddenField('Unit to be removed', validators=[DataRequired('Please pick a unit.'), known_unit])
     submit = SubmitField('Remove now!')
 
 class RemoveTask(FlaskForm):
@@ -215,7 +245,7 @@ class DeactivateProject(FlaskForm):
     submit = SubmitField('Deactivate now!')
 
 class ModifyUnit(FlaskForm):
-    unit = SelectField('Unit to be modified', validators=[DataRequired()])
+    unit = HiddenField('Unit to be modified', validators=[DataRequired('Please pick a unit.'), known_unit])
     project = SelectField('Change to', validators=[DataRequired()])
     submit = SubmitField('Modify now!')
 
@@ -232,4 +262,9 @@ class GetUsers(FlaskForm):
 
 class GetProjects(FlaskForm):
     projects = SelectField('Please select a project: ', validators=[DataRequired()])
-    submit = SubmitField('Change project now!')
\ No newline at end of file
+    submit = SubmitField('Change project now!')
+
+class ImportTimeEntries(FlaskForm):
+    file = FileField('CSV or Excel file (columns: user, hov, pn, task, date, hours)',
+                     validators=[FileRequired(), FileAllowed(['csv', 'xlsx'])])
+    submit = SubmitField('Import time entries')
@@ -0,0 +1,217 @@
+import codecs
+import csv
+import os
+import zipfile
+from collections import defaultdict
+from datetime import date, datetime
+
+from pm_app import db
+from pm_app.models import User, Project, Unit, Task, WorkedFor
+from pm_app.rollups import add_unit_hours, touch_rollups
+from pm_app.versions import touch
+
+# Columns of an import file, the header row is required (case and order do not matter)
+IMPORT_COLUMNS = ('user', 'hov', 'pn', 'task', 'date', 'hours')
+# Rows checked for duplicates and inserted at once
+IMPORT_BATCH_SIZE = 5000
+# Units per IN (...) of the duplicate check, below SQLite's limit of bound parameters
+IMPORT_UNIT_CHUNK = 500
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y')
+
+
+class ImportFileError(Exception):
+    pass
+
+# Yields (line number, row dict) from a CSV file without loading it into memory
+def _read_csv(stream):
+    reader = csv.reader(codecs.iterdecode(stream, 'utf-8-sig'))
+    try:
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.strip().lower() for column in header]
+        for line, values in enumerate(reader, start=2):
+            if any(value.strip() for value in values):
+                yield line, dict(zip(header, values))
+    except (csv.Error, UnicodeDecodeError) as error:
+        raise ImportFileError(f'Invalid CSV file: {error}')
+
+# Yields (line number, row dict) from the first sheet of an XLSX file in read-only mode
+def _read_xlsx(stream):
+    try:
+        import openpyxl
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ImportFileError('Reading Excel files requires openpyxl (pip install openpyxl)')
+    # A corrupt file or another format with an .xlsx name fails in the zip or XML reader
+    invalid = (zipfile.BadZipFile, InvalidFileException, KeyError, ValueError, OSError, IndexError)
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except invalid as error:
+        raise ImportFileError(f'Invalid Excel file: {error}')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(column or '').strip().lower() for column in header]
+        for line, values in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in values):
+                yield line, dict(zip(header, values))
+    except invalid as error:
+        raise ImportFileError(f'Invalid Excel file: {error}')
+    finally:
+        workbook.close()
+
+def read_rows(stream, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return _read_csv(stream)
+    if extension == '.xlsx':
+        return _read_xlsx(stream)
+    raise ImportFileError(f'Unsupported file type {extension!r}, use .csv or .xlsx')
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = _text(value)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f'invalid date {value!r}')
+
+# (unit_id, day) pairs already booked for the given units between the first and the last day,
+# with one range query on the (unit_id, date_of_work) index per IMPORT_UNIT_CHUNK units
+def _booked(unit_ids, first, last):
+    unit_ids = sorted(unit_ids)
+    start = datetime.combine(first, datetime.min.time())
+    end = datetime.combine(last, datetime.max.time())
+    booked = set()
+    for offset in range(0, len(unit_ids), IMPORT_UNIT_CHUNK):
+        booked.update(
+            (unit_id, day.date()) for unit_id, day in
+            db.session.query(WorkedFor.unit_id, WorkedFor.date_of_work)
+            .filter(
+                WorkedFor.unit_id.in_(unit_ids[offset:offset + IMPORT_UNIT_CHUNK]),
+                WorkedFor.date_of_work >= start,
+                WorkedFor.date_of_work <= end,
+                )
+        )
+    return booked
+
+# Import time entries from (line number, row) pairs as produced by read_rows.
+# Users, projects, units and tasks are resolved through lookup maps built once. The valid rows
+# are collected in batches of batch_size, so the file is streamed: the existing entries of a
+# batch's units and date range are loaded to find duplicates (an entry for the same unit on the
+# same day), then the batch is inserted and later batches see it as existing. Everything is
+# committed in a single transaction at the end.
+# Returns the number of imported entries and the (line number, message) of every invalid row.
+def import_time_entries(rows, batch_size=IMPORT_BATCH_SIZE):
+    users = {}
+    for user_id, username, email in db.session.query(User.id, User.username, User.email):
+        users[username.strip().lower()] = user_id
+        users[email.strip().lower()] = user_id
+    projects = {hov.strip(): project_id for project_id, hov in db.session.query(Project.id, Project.hov)}
+    units = {
+        (project_id, _text(pn)): unit_id
+        for unit_id, project_id, pn in db.session.query(Unit.id, Unit.project_id, Unit.pn)
+    }
+    tasks = {name.strip().lower(): task_id for task_id, name in db.session.query(Task.id, Task.task_name)}
+
+    table = WorkedFor.__table__
+    valid = []
+    errors = []
+    hours_per_unit = defaultdict(float)
+    imported = 0
+
+    # Check a batch of valid rows against the existing entries and each other, then insert it
+    def insert(valid):
+        booked = _booked(
+            {entry[2] for entry in valid},
+            min(entry[4] for entry in valid),
+            max(entry[4] for entry in valid),
+            )
+        batch = []
+        for line, user_id, unit_id, task_id, day, hours, pn in valid:
+            if (unit_id, day) in booked:
+                errors.append((line, f'Time entry already exists for P/N {pn} on {day}'))
+                continue
+            booked.add((unit_id, day))
+            batch.append(dict(
+                user_id=user_id,
+                unit_id=unit_id,
+                task_id=task_id,
+                time_amount=hours,
+                date_of_work=datetime.combine(day, datetime.min.time()),
+            ))
+            hours_per_unit[unit_id] += hours
+        if batch:
+            db.session.execute(table.insert(), batch)
+        return len(batch)
+
+    for line, row in rows:
+        missing = [column for column in IMPORT_COLUMNS if _text(row.get(column)) == '']
+        if missing:
+            errors.append((line, f"Missing value(s) for {', '.join(missing)}"))
+            continue
+
+        user_id = users.get(_text(row['user']).lower())
+        project_id = projects.get(_text(row['hov']))
+        unit_id = units.get((project_id, _text(row['pn'])))
+        task_id = tasks.get(_text(row['task']).lower())
+        if user_id is None:
+            errors.append((line, f"Unknown user {_text(row['user'])!r}"))
+            continue
+        if project_id is None:
+            errors.append((line, f"Unknown HoV {_text(row['hov'])!r}"))
+            continue
+        if unit_id is None:
+            errors.append((line, f"Unknown P/N {_text(row['pn'])!r} in {_text(row['hov'])}"))
+            continue
+        if task_id is None:
+            errors.append((line, f"Unknown task {_text(row['task'])!r}"))
+            continue
+
+        try:
+            day = _parse_date(row['date'])
+        except ValueError as error:
+            errors.append((line, str(error).capitalize()))
+            continue
+        try:
+            hours = float(_text(row['hours']).replace(',', '.'))
+        except ValueError:
+            errors.append((line, f"Invalid hours {_text(row['hours'])!r}"))
+            continue
+        if not 0 < hours <= 24:
+            errors.append((line, f'Hours must be between 0 and 24, got {hours}'))
+            continue
+
+        valid.append((line, user_id, unit_id, task_id, day, hours, _text(row['pn'])))
+        if len(valid) >= batch_size:
+            imported += insert(valid)
+            valid = []
+
+    if valid:
+        imported += insert(valid)
+
+    # Bulk inserts bypass the ORM, so the rollups and data versions are updated here in the same transaction
+    for unit_id, hours in hours_per_unit.items():
+        add_unit_hours(db.session, unit_id, hours)
+    touch_rollups(db.session)
+    if imported:
+        touch(db.session, [table.name])
+    db.session.commit()
+
+    errors.sort(key=lambda error: error[0])
+    return imported, errors
@@ -0,0 +1,116 @@
+import logging
+import time
+from collections import Counter
+
+from flask import (
+    current_app, g, request, has_request_context, before_render_template, template_rendered
+    )
+from sqlalchemy import event
+
+from pm_app import db
+
+# Slow queries and N+1 candidates, below the app's logger (or into SLOW_QUERY_LOG)
+logger = logging.getLogger('pm_app.sql')
+# Longest statement and parameters written to the log
+LOG_STATEMENT_LENGTH = 500
+
+
+# Queries, SQL time and template render time of one request, kept in g
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_starts = []
+        self.statements = Counter()
+
+    def server_timing(self):
+        total = time.perf_counter() - self.start
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'render;dur={self.render_time * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}')
+
+def _route():
+    if not has_request_context():
+        return '(no request)'
+    return f'{request.method} {request.path} ({request.endpoint})'
+
+def _shorten(value):
+    value = ' '.join(str(value).split())
+    return value if len(value) <= LOG_STATEMENT_LENGTH else value[:LOG_STATEMENT_LENGTH] + '...'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _slow_query_listener(threshold_ms):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        stats = g.get('_request_stats') if has_request_context() else None
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            stats.statements[statement] += 1
+        if elapsed * 1000 >= threshold_ms:
+            logger.warning('Slow query (%.1f ms) on %s: %s | parameters %s',
+                           elapsed * 1000, _route(), _shorten(statement), _shorten(parameters))
+    return after_cursor_execute
+
+def _before_render(app, template, context, **extra):
+    stats = g.get('_request_stats')
+    if stats is not None:
+        stats.render_starts.append(time.perf_counter())
+
+def _after_render(app, template, context, **extra):
+    stats = g.get('_request_stats')
+    if stats is not None and stats.render_starts:
+        start = stats.render_starts.pop()
+        # Only the outermost template, included ones are part of its time
+        if not stats.render_starts:
+            stats.render_time += time.perf_counter() - start
+
+def _start_request():
+    if current_app.extensions['sql_instrumentation']:
+        g._request_stats = RequestStats()
+
+def _finish_request(response):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return response
+    threshold = current_app.config['N_PLUS_ONE_THRESHOLD']
+    for statement, count in stats.statements.most_common():
+        if count < threshold:
+            break
+        logger.warning('Possible N+1 on %s: %d x %s', _route(), count, _shorten(statement))
+    response.headers.add('Server-Timing', stats.server_timing())
+    return response
+
+# Count the queries and the SQL and render time of every request, sent back in a Server-Timing
+# header, and log slow queries and statements repeated within one request (N+1 candidates).
+# On in debug mode unless SQL_INSTRUMENTATION says otherwise. The engine listeners are only
+# added when it is on, so a production app without it only pays for a flag check per request.
+def init_app(app):
+    app.extensions['sql_instrumentation'] = False
+
+    def enable():
+        enabled = app.config['SQL_INSTRUMENTATION']
+        if enabled is None:
+            enabled = app.debug
+        if not enabled:
+            return
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _slow_query_listener(app.config['SLOW_QUERY_MS']))
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        if app.config['SLOW_QUERY_LOG'] and not logger.handlers:
+            handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+        app.extensions['sql_instrumentation'] = True
+
+    # app.debug is only final once the server runs (app.run(debug=True)), so this is decided
+    # on the first request, before its before_request functions
+    app.before_first_request(enable)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
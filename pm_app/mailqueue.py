@@ -0,0 +1,192 @@
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message, BadHeaderError
+from sqlalchemy import func
+
+from pm_app import db, mail
+from pm_app.models import OutboundMail
+
+# Mails sent over one SMTP connection
+MAIL_BATCH_SIZE = 20
+# A mail being sent holds this lease, if its worker dies the mail is retried once it expired
+MAIL_SENDING_LEASE = timedelta(minutes=10)
+
+
+# Queue a flask_mail Message instead of sending it, the request does not wait for the SMTP server
+def enqueue(message):
+    entry = OutboundMail(
+        subject=message.subject,
+        sender=message.sender if isinstance(message.sender, str) else message.sender[1],
+        recipients=','.join(message.recipients),
+        body=message.body,
+        )
+    db.session.add(entry)
+    db.session.commit()
+    current_app.extensions['mail_workers'].wake()
+    return entry
+
+def _message(entry):
+    return Message(
+        entry.subject,
+        sender=entry.sender,
+        recipients=entry.recipients.split(','),
+        body=entry.body,
+        )
+
+# Claim up to limit due mails for this worker. A mail is only claimed if it is still pending,
+# so several workers (threads or processes) never send the same mail.
+def _claim(limit):
+    now = datetime.utcnow()
+    OutboundMail.query.filter(
+        OutboundMail.status == 'sending',
+        OutboundMail.next_attempt_at <= now,
+        ).update(dict(status='pending'), synchronize_session=False)
+
+    due = (db.session
+           .query(OutboundMail.id)
+           .filter(OutboundMail.status == 'pending', OutboundMail.next_attempt_at <= now)
+           .order_by(OutboundMail.next_attempt_at, OutboundMail.id)
+           .limit(limit)
+           .all()
+           )
+    claimed = []
+    for mail_id, in due:
+        if OutboundMail.query.filter(
+                OutboundMail.id == mail_id,
+                OutboundMail.status == 'pending',
+                ).update(dict(status='sending', next_attempt_at=now + MAIL_SENDING_LEASE),
+                         synchronize_session=False):
+            claimed.append(mail_id)
+    db.session.commit()
+    if not claimed:
+        return []
+    return OutboundMail.query.filter(OutboundMail.id.in_(claimed)).order_by(OutboundMail.id).all()
+
+# Back to the queue with an exponential backoff, or failed after MAIL_MAX_ATTEMPTS
+def _retry_later(entry, error):
+    entry.attempts += 1
+    entry.last_error = f'{type(error).__name__}: {error}'
+    if entry.attempts >= current_app.config['MAIL_MAX_ATTEMPTS']:
+        entry.status = 'failed'
+        entry.body = ''
+        current_app.logger.error('Giving up on mail %s to %s: %s', entry.id, entry.recipients, entry.last_error)
+    else:
+        entry.status = 'pending'
+        entry.next_attempt_at = datetime.utcnow() + timedelta(
+            seconds=current_app.config['MAIL_RETRY_DELAY'] * 2 ** (entry.attempts - 1))
+
+# Send one batch of due mails over a single SMTP connection. Returns the number of claimed mails.
+def send_due(limit=MAIL_BATCH_SIZE):
+    entries = _claim(limit)
+    if not entries:
+        return 0
+    try:
+        with mail.connect() as connection:
+            for entry in entries:
+                try:
+                    connection.send(_message(entry))
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except (smtplib.SMTPException, BadHeaderError, AssertionError) as error:
+                    _retry_later(entry, error)
+                else:
+                    entry.attempts += 1
+                    entry.status = 'sent'
+                    entry.date_sent = datetime.utcnow()
+                    entry.last_error = None
+                    entry.body = ''
+                db.session.commit()
+    except Exception as error:
+        # Connecting failed or the connection broke, the mails not sent yet are retried
+        for entry in entries:
+            if entry.status == 'sending':
+                _retry_later(entry, error)
+        db.session.commit()
+    return len(entries)
+
+# Send everything that is due, e.g. from the CLI. Returns the number of claimed mails.
+def drain():
+    total = 0
+    while True:
+        claimed = send_due()
+        if not claimed:
+            return total
+        total += claimed
+
+# Delete the sent and failed mails older than retention (MAIL_RETENTION_DAYS by default).
+# Returns the number of deleted mails.
+def purge(retention=None):
+    if retention is None:
+        retention = timedelta(days=current_app.config['MAIL_RETENTION_DAYS'])
+    deleted = OutboundMail.query.filter(
+        OutboundMail.status.in_(('sent', 'failed')),
+        OutboundMail.date_created < datetime.utcnow() - retention,
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# Number of queued mails per status
+def queue_stats():
+    return dict(
+        db.session
+        .query(OutboundMail.status, func.count(OutboundMail.id))
+        .group_by(OutboundMail.status)
+        .all()
+        )
+
+
+# Background threads sending the queue. They are started on the first request or the first
+# queued mail of a process, woken up by every queued mail and poll for retries in between.
+class MailWorkerPool:
+    def __init__(self, app, size, poll_interval):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._threads or not self.size:
+                return
+            self._stop.clear()
+            for number in range(self.size):
+                thread = threading.Thread(target=self._run, name=f'mail-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wake.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    while send_due() and not self._stop.is_set():
+                        pass
+                    purge()
+                except Exception:
+                    self.app.logger.exception('Sending queued mail failed')
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+def init_app(app):
+    workers = MailWorkerPool(app, app.config['MAIL_WORKERS'], app.config['MAIL_POLL_INTERVAL'])
+    app.extensions['mail_workers'] = workers
+    app.before_first_request(workers.start)
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects import sqlite
+
+from pm_app import db
+from pm_app.models import Unit, WorkedFor, Admin, Supervisor, Post
+
+# Versioned schema changes for existing databases. db.create_all() only creates missing
+# tables, so everything that changes an existing table goes here. Each migration is
+# (version, description, statements); applied versions are recorded in schema_version.
+# Append new migrations at the end, never edit or reorder applied ones.
+# A migration listed in MIGRATION_DIALECTS only runs its statements on that database
+# dialect, on the others it is recorded as applied without them.
+MIGRATIONS = [
+    (1, 'Indexes on the hot query columns', [
+        'CREATE INDEX IF NOT EXISTS ix_worked_for_unit_id_date_of_work ON worked_for (unit_id, date_of_work)',
+        'CREATE INDEX IF NOT EXISTS ix_worked_for_user_id_date_of_work ON worked_for (user_id, date_of_work)',
+        'CREATE INDEX IF NOT EXISTS ix_worked_for_task_id ON worked_for (task_id)',
+        'CREATE INDEX IF NOT EXISTS ix_worked_for_date_of_work ON worked_for (date_of_work)',
+        'CREATE INDEX IF NOT EXISTS ix_unit_project_id ON unit (project_id)',
+        'CREATE INDEX IF NOT EXISTS ix_unit_pn ON unit (pn)',
+        'CREATE INDEX IF NOT EXISTS ix_supervisor_user_id ON supervisor (user_id)',
+    ]),
+    (2, 'Indexes for the keyset pagination of posts', [
+        'CREATE INDEX IF NOT EXISTS ix_post_date_posted_id ON post (date_posted, id)',
+        'CREATE INDEX IF NOT EXISTS ix_post_user_id_date_posted_id ON post (user_id, date_posted, id)',
+    ]),
+    # Full-text index of the units for the unit autocomplete (see pm_app.search), one row per
+    # unit with the unit id as rowid, kept in sync with unit and project by triggers
+    (3, 'Full-text index of the units', [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS unit_search USING fts5("
+        "pn, pn_name, hov, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')",
+        'DELETE FROM unit_search',
+        'INSERT INTO unit_search (rowid, pn, pn_name, hov) '
+        'SELECT unit.id, unit.pn, unit.pn_name, project.hov FROM unit JOIN project ON project.id = unit.project_id',
+        'CREATE TRIGGER IF NOT EXISTS unit_search_insert AFTER INSERT ON unit BEGIN '
+        'INSERT INTO unit_search (rowid, pn, pn_name, hov) '
+        'VALUES (new.id, new.pn, new.pn_name, (SELECT hov FROM project WHERE id = new.project_id)); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS unit_search_update AFTER UPDATE OF pn, pn_name, project_id ON unit BEGIN '
+        'DELETE FROM unit_search WHERE rowid = old.id; '
+        'INSERT INTO unit_search (rowid, pn, pn_name, hov) '
+        'VALUES (new.id, new.pn, new.pn_name, (SELECT hov FROM project WHERE id = new.project_id)); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS unit_search_delete AFTER DELETE ON unit BEGIN '
+        'DELETE FROM unit_search WHERE rowid = old.id; '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS unit_search_project_hov AFTER UPDATE OF hov ON project BEGIN '
+        'UPDATE unit_search SET hov = new.hov WHERE rowid IN (SELECT id FROM unit WHERE project_id = new.id); '
+        'END',
+    ]),
+    # Full-text index of the forum posts (see pm_app.search) with English stemming. The index
+    # reads the text from post (external content), the triggers keep it in sync, title matches
+    # rank ten times higher.
+    (4, 'Full-text index of the posts', [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING fts5("
+        "title, content, content = 'post', content_rowid = 'id', tokenize = 'porter unicode61 remove_diacritics 2')",
+        "INSERT INTO post_search (post_search, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+        "INSERT INTO post_search (post_search) VALUES ('rebuild')",
+        'CREATE TRIGGER IF NOT EXISTS post_search_insert AFTER INSERT ON post BEGIN '
+        'INSERT INTO post_search (rowid, title, content) VALUES (new.id, new.title, new.content); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS post_search_update AFTER UPDATE OF title, content ON post BEGIN '
+        "INSERT INTO post_search (post_search, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+        'INSERT INTO post_search (rowid, title, content) VALUES (new.id, new.title, new.content); '
+        'END',
+        'CREATE TRIGGER IF NOT EXISTS post_search_delete AFTER DELETE ON post BEGIN '
+        "INSERT INTO post_search (post_search, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+        'END',
+    ]),
+]
+
+MIGRATION_DIALECTS = {
+    3: 'sqlite',    # FTS5
+    4: 'sqlite',    # FTS5
+}
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER NOT NULL PRIMARY KEY, '
+        'description VARCHAR(200) NOT NULL, '
+        'applied_at DATETIME NOT NULL)'
+        ))
+
+def current_version(connection=None):
+    connection = connection or db.engine
+    _ensure_version_table(connection)
+    version = connection.execute(text('SELECT MAX(version) FROM schema_version')).scalar()
+    return version or 0
+
+# Apply all pending migrations, each one in its own transaction. Returns the applied versions.
+def upgrade():
+    applied = []
+    with db.engine.begin() as connection:
+        version = current_version(connection)
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with db.engine.begin() as connection:
+            if MIGRATION_DIALECTS.get(migration_version, connection.dialect.name) != connection.dialect.name:
+                statements = []
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'),
+                dict(version=migration_version, description=description,
+                     applied_at=datetime.utcnow()),
+                )
+        applied.append(migration_version)
+    return applied
+
+# The queries every hot path runs, with the index each one has to use
+def hot_queries():
+    day = datetime(2021, 1, 4)
+    return [
+        ('duplicate check in get_time',
+         WorkedFor.query.filter_by(unit_id=1, date_of_work=day),
+         'ix_worked_for_unit_id_date_of_work'),
+        ('calendar range of all users',
+         WorkedFor.query.filter(
+             WorkedFor.date_of_work >= day,
+             WorkedFor.date_of_work < day + timedelta(weeks=5)),
+         'ix_worked_for_date_of_work'),
+        ('calendar range of one user',
+         WorkedFor.query.filter(
+             WorkedFor.user_id == 1,
+             WorkedFor.date_of_work >= day,
+             WorkedFor.date_of_work < day + timedelta(weeks=5)),
+         'ix_worked_for_user_id_date_of_work'),
+        ('entries of a unit (rollups, delete_unit)',
+         WorkedFor.query.filter_by(unit_id=1),
+         'ix_worked_for_unit_id_date_of_work'),
+        ('entries of a task (delete_task)',
+         WorkedFor.query.filter_by(task_id=1),
+         'ix_worked_for_task_id'),
+        ('units of a project',
+         Unit.query.filter_by(project_id=1),
+         'ix_unit_project_id'),
+        ('unit by P/N',
+         Unit.query.filter_by(pn='1101000-020'),
+         'ix_unit_pn'),
+        ('admin role of a user',
+         Admin.query.filter_by(user_id=1),
+         'sqlite_autoindex_admin_1'),
+        ('supervisor role of a user',
+         Supervisor.query.filter_by(user_id=1),
+         'ix_supervisor_user_id'),
+        ('page of the post feed',
+         Post.query
+         .filter(tuple_(Post.date_posted, Post.id) < tuple_(day, 1000))
+         .order_by(Post.date_posted.desc(), Post.id.desc()).limit(6),
+         'ix_post_date_posted_id'),
+        ("page of a user's posts",
+         Post.query
+         .filter(Post.user_id == 1, tuple_(Post.date_posted, Post.id) < tuple_(day, 1000))
+         .order_by(Post.date_posted.desc(), Post.id.desc()).limit(6),
+         'ix_post_user_id_date_posted_id'),
+    ]
+
+# Run EXPLAIN QUERY PLAN for every hot query. Returns (name, expected index, plan, ok) tuples.
+def explain_hot_queries():
+    dialect = sqlite.dialect(paramstyle='named')
+    results = []
+    for name, query, index in hot_queries():
+        compiled = query.statement.compile(dialect=dialect)
+        params = {
+            key: str(value) if isinstance(value, datetime) else value
+            for key, value in compiled.params.items()
+        }
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'), params).fetchall()
+        plan = [row[-1] for row in rows]
+        results.append((name, index, plan, any(index in detail for detail in plan)))
+    return results
@@ -1,14 +1,40 @@
 from datetime import datetime
 
+from flask import current_app
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from sqlalchemy.orm import lazyload
-from pm_app import db, login_manager, app, bcrypt
+from pm_app import db, login_manager, bcrypt
+from pm_app.caching import TTLCache
 from flask_login import UserMixin
 
+# Detached copies of recently loaded users, keyed by id, one cache per app
+def init_app(app):
+    app.extensions['user_cache'] = TTLCache(
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL'],
+        )
+
+def get_user_cache():
+    return current_app.extensions['user_cache']
 
+# Cached users are merged into the request's session without a query (load=False),
+# so changes to current_user are still committed as before.
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user_cache = get_user_cache()
+    user = user_cache.get(user_id)
+    if user is None:
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        db.session.expunge(user)
+        user_cache.set(user_id, user)
+    return db.session.merge(user, load=False)
+
+# Drop a user from the loader cache after it has been changed or removed
+def invalidate_user(user_id):
+    get_user_cache().pop(int(user_id))
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -22,12 +48,12 @@ class User(db.Model, UserMixin):
     workedfor = db.relationship('WorkedFor', backref='author', lazy=True)
 
     def get_reset_token(self, expires_sec=1800):
-        s = Serializer(app.config['SECRET_KEY'], expires_sec)
+        s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
         return s.dumps({'user_id': self.id}).decode('utf-8')
 
     @staticmethod
     def verify_reset_token(token):
-        s = Serializer(app.config['SECRET_KEY'])
+        s = Serializer(current_app.config['SECRET_KEY'])
         try:
             user_id = s.loads(token)['user_id']
         except:
@@ -40,7 +66,7 @@ class User(db.Model, UserMixin):
 # Create a table of supervisors, which refer to the User.id as foreign key | supervisors see anything. Can't change anything. 
 class Supervisor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
     def __repr__(self):
         return f"Supervisors('{self.user_id}')"
@@ -54,6 +80,12 @@ class Admin(db.Model):
         return f"Admins('{self.user_id}')"
 
 class Post(db.Model):
+    # Keyset pagination of the feed and of a user's posts (see pm_app.feed)
+    __table_args__ = (
+        db.Index('ix_post_date_posted_id', 'date_posted', 'id'),
+        db.Index('ix_post_user_id_date_posted_id', 'user_id', 'date_posted', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -81,8 +113,8 @@ class Project(db.Model):
 
 class Unit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer,db.ForeignKey('project.id'), nullable=False)
-    pn = db.Column(db.Integer,nullable=False, unique=False)
+    project_id = db.Column(db.Integer,db.ForeignKey('project.id'), nullable=False, index=True)
+    pn = db.Column(db.Integer,nullable=False, unique=False, index=True)
     pn_name = db.Column(db.Text(100),unique=False)
 
     workedfor = db.relationship('WorkedFor',backref='unit',lazy=True)
@@ -100,19 +132,72 @@ class Task(db.Model):
         return f"Tasks('{self.task}')"
 
 class WorkedFor(db.Model):
+    # Composite indexes for the duplicate check (unit per day) and the calendar (user per date range)
+    __table_args__ = (
+        db.Index('ix_worked_for_unit_id_date_of_work', 'unit_id', 'date_of_work'),
+        db.Index('ix_worked_for_user_id_date_of_work', 'user_id', 'date_of_work'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     user_id = db.Column(db.Integer,db.ForeignKey('user.id'), nullable=False)
     unit_id = db.Column(db.Integer,db.ForeignKey('unit.id'), nullable=False)
-    task_id = db.Column(db.Integer,db.ForeignKey('task.id'), nullable=False)
+    task_id = db.Column(db.Integer,db.ForeignKey('task.id'), nullable=False, index=True)
 
     time_amount = db.Column(db.Float, nullable=False)
-    date_of_work = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_of_work = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     def __repr__(self):
         return f"WorkedFor(user_id:{self.user_id}, unit_id:{self.unit_id}, task_id:{self.task_id}, time_amount:{self.time_amount}, date_of_work:{self.date_of_work})"
 
-db.create_all()
+# Running totals per project and per unit, kept up to date by pm_app.rollups on every flush
+class ProjectRollup(db.Model):
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), primary_key=True)
+    total_hours = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"ProjectRollup(project_id:{self.project_id}, total_hours:{self.total_hours}, total_cost:{self.total_cost})"
+
+class UnitRollup(db.Model):
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'), primary_key=True)
+    total_hours = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"UnitRollup(unit_id:{self.unit_id}, total_hours:{self.total_hours}, total_cost:{self.total_cost})"
+
+# Outgoing mail waiting to be sent by the mail queue (see pm_app.mailqueue). The body, which
+# may hold a password reset link, is cleared once the mail is sent or given up.
+class OutboundMail(db.Model):
+    __table_args__ = (
+        db.Index('ix_outbound_mail_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    sender = db.Column(db.String(120), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent, or back to pending for a retry, or failed after the last attempt
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_sent = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"OutboundMail('{self.subject}', '{self.recipients}', '{self.status}')"
+
+# Change counter per table, bumped in the transaction of every flush that touches the table.
+# Clients and caches compare versions instead of recomputing the data (see pm_app.versions).
+class DataVersion(db.Model):
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"DataVersion(table_name:{self.table_name}, version:{self.version})"
 
 def add_column(engine, table_name, column):
     column_name = column.compile(dialect=engine.dialect)
@@ -204,12 +289,17 @@ def create_dummy_projects():
         n+=1
     db.session.commit()
 
-if Project.query.all() == []:
-    create_dummy_projects()
-
-if Task.query.all() == []:
-    create_dummy_task()
-
-if Admin.query.all() == []:
-    create_admin()
-
+# Demo data for an empty database (flask seed-db). Each part is only added if its table is
+# empty, checked with an EXISTS query instead of loading the whole table.
+def seed_database():
+    seeded = []
+    if not db.session.query(Project.query.exists()).scalar():
+        create_dummy_projects()
+        seeded.append('projects')
+    if not db.session.query(Task.query.exists()).scalar():
+        create_dummy_task()
+        seeded.append('tasks')
+    if not db.session.query(Admin.query.exists()).scalar():
+        create_admin()
+        seeded.append('admin')
+    return seeded
@@ -0,0 +1,51 @@
+from flask import current_app, request, render_template
+from markupsafe import Markup
+
+from pm_app.caching import TTLCache, SQLiteCache, NullCache
+from pm_app.roles import get_roles
+from pm_app.versions import data_versions
+
+
+def make_response_cache(config):
+    backend = config['RESPONSE_CACHE']
+    if backend == 'memory':
+        return TTLCache(maxsize=config['RESPONSE_CACHE_SIZE'], ttl=config['RESPONSE_CACHE_TTL'])
+    if backend == 'sqlite':
+        return SQLiteCache(config['RESPONSE_CACHE_PATH'],
+                           maxsize=config['RESPONSE_CACHE_SIZE'], ttl=config['RESPONSE_CACHE_TTL'])
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f"Unknown RESPONSE_CACHE {backend!r}, use 'memory', 'sqlite' or 'none'")
+
+def init_app(app):
+    app.extensions['response_cache'] = make_response_cache(app.config)
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+# Only the content block of a template: the layout around it shows the logged-in user and
+# the flashed messages, which must never come from the cache
+def render_content(template_name, **context):
+    template = current_app.jinja_env.get_template(template_name)
+    current_app.update_template_context(context)
+    return ''.join(template.blocks['content'](template.new_context(context)))
+
+# Render a page whose content only depends on the given tables. The content is cached per
+# route (path and query string) and role, with the versions of the tables in the key: every
+# flush that writes to one of them bumps its version (see pm_app.versions), so a cached page
+# is never served stale.
+# build returns the template context and is only called on a miss.
+def render_cached(template_name, tables, build, **context):
+    versions = data_versions(tables)
+    key = '|'.join([
+        request.endpoint,
+        request.full_path,
+        ','.join(sorted(get_roles())) or 'anonymous',
+        ','.join(f'{name}:{versions[name]}' for name in sorted(versions)),
+        ])
+    response_cache = get_response_cache()
+    content = response_cache.get(key)
+    if content is None:
+        content = render_content(template_name, **build(), **context)
+        response_cache.set(key, content)
+    return render_template('cached_page.html', content=Markup(content), **context)
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from flask import Blueprint, current_app, url_for, send_from_directory, abort
+
+pictures = Blueprint('pictures', __name__)
+
+PICTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'profile_pics')
+# Square sizes in px: 65 and 125 as displayed by main.css, 130 and 250 for 2x displays
+PICTURE_SIZES = (65, 125, 130, 250)
+# (extension, PIL format, save options) of the files written for every size
+PICTURE_FORMATS = (
+    ('webp', 'WEBP', dict(quality=80, method=4)),
+    ('jpg', 'JPEG', dict(quality=85, optimize=True, progressive=True)),
+    )
+# Pictures are named after their content, so they can be cached for good
+PICTURE_MAX_AGE = 365 * 24 * 3600
+PICTURE_NAME = re.compile(r'^[0-9a-f]{16}-\d+\.(webp|jpg)$')
+
+# An upload that is not a complete image in a format PIL can read
+class PictureError(Exception):
+    pass
+
+# Keys whose files are known to be complete, the files are never changed once written
+_ready = set()
+
+
+# Key of a picture: the start of the SHA-256 of the upload, short enough for User.image_file
+def picture_key(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def is_picture_key(image_file):
+    return bool(re.fullmatch(r'[0-9a-f]{16}', image_file or ''))
+
+def picture_name(key, size, extension):
+    return f'{key}-{size}.{extension}'
+
+def pictures_ready(key):
+    if key not in _ready:
+        # The largest JPEG is written last
+        if not os.path.exists(os.path.join(PICTURE_DIR, picture_name(key, PICTURE_SIZES[-1], 'jpg'))):
+            return False
+        _ready.add(key)
+    return True
+
+# Decode the upload once and write every size and format. Each file is written to a temporary
+# file first and then renamed, so a half written picture is never served. PIL is only imported
+# when a picture is uploaded, not when the app starts.
+def render_pictures(key, data):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    else:
+        image = image.convert('RGB')
+
+    for size in PICTURE_SIZES:
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for extension, image_format, options in PICTURE_FORMATS:
+            path = os.path.join(PICTURE_DIR, picture_name(key, size, extension))
+            if os.path.exists(path):
+                continue
+            descriptor, temporary = tempfile.mkstemp(dir=PICTURE_DIR, suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as stream:
+                    resized.save(stream, image_format, **options)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+
+def _render_pictures(app, key, data):
+    try:
+        render_pictures(key, data)
+    except Exception:
+        app.logger.exception('Rendering profile picture %s failed', key)
+
+# Decode the upload at a reduced scale to check it in the request: opening an image only reads
+# its header, so a truncated file would pass and then fail in the picture pool. JPEGs are decoded
+# at the smallest scale that still covers the largest size, which is cheap; raises PictureError.
+def check_picture(data):
+    from PIL import Image
+
+    try:
+        image = Image.open(BytesIO(data))
+        image.draft('RGB', (PICTURE_SIZES[-1], PICTURE_SIZES[-1]))
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise PictureError(str(error))
+
+# Store an uploaded profile picture and return its key for User.image_file. The request hashes
+# the upload and checks that it decodes (check_picture); resizing and encoding run in the
+# picture pool. An upload whose pictures already exist is not processed again. Raises
+# PictureError for an upload that is not a readable image.
+def save_picture(form_picture):
+    data = form_picture.read()
+    check_picture(data)
+    key = picture_key(data)
+    if not pictures_ready(key):
+        current_app.extensions['picture_executor'].submit(
+            _render_pictures, current_app._get_current_object(), key, data)
+    return key
+
+# URLs of a profile picture shown at size px: WebP and JPEG for 1x and 2x displays. Pictures
+# uploaded before they were content addressed, and pictures still being rendered, only have a
+# single file in static/profile_pics.
+@pictures.app_template_global()
+def picture_urls(image_file, size):
+    if is_picture_key(image_file):
+        if pictures_ready(image_file):
+            return dict(
+                (f'{extension}{suffix}', url_for('pictures.profile_picture', filename=picture_name(image_file, scale * size, extension)))
+                for extension, _, _ in PICTURE_FORMATS
+                for scale, suffix in ((1, ''), (2, '_2x'))
+                )
+        image_file = 'default.jpg'
+    return dict(jpg=url_for('static', filename='profile_pics/' + image_file))
+
+@pictures.route('/pictures/<string:filename>')
+def profile_picture(filename):
+    if not PICTURE_NAME.match(filename):
+        abort(404)
+    response = send_from_directory(PICTURE_DIR, filename, cache_timeout=PICTURE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={PICTURE_MAX_AGE}, immutable'
+    return response
+
+def init_app(app):
+    app.extensions['picture_executor'] = ThreadPoolExecutor(
+        max_workers=app.config['PICTURE_WORKERS'], thread_name_prefix='picture')
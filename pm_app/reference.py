@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import defaultdict
+from functools import cached_property
+
+from flask import current_app, has_app_context
+
+from pm_app import db
+from pm_app.models import User, Admin, Supervisor, Project, Unit, Task
+from pm_app.directory import directory_query
+from pm_app.versions import data_versions, on_commit
+
+# Projects, units, tasks and users change rarely but fill the select fields of most forms.
+# They are read into an immutable snapshot once and the choice lists are built from it, so
+# form pages do not query these tables. A commit that writes to one of them drops the
+# snapshot of this process; other processes notice the new data versions within
+# REFERENCE_DATA_CHECK_INTERVAL seconds.
+REFERENCE_TABLES = tuple(model.__tablename__ for model in (User, Admin, Supervisor, Project, Unit, Task))
+
+
+# The reference tables as rows, with the choice lists built on first use
+class ReferenceData:
+    def __init__(self, versions, projects, units, tasks, users):
+        self.versions = versions
+        self.projects = projects
+        self.units = units
+        self.tasks = tasks
+        self.users = users
+        self.project_by_id = {project.id: project for project in projects}
+        self.project_by_hov = {project.hov: project for project in projects}
+        self.unit_by_id = {unit.id: unit for unit in units}
+        self.units_by_project = defaultdict(list)
+        for unit in units:
+            self.units_by_project[unit.project_id].append(unit)
+
+    @cached_property
+    def project_choices(self):
+        return [(project.id, project.hov) for project in self.projects]
+
+    @cached_property
+    def project_customer_choices(self):
+        return [(project.id, f'{project.hov} ({project.customer_name})') for project in self.projects]
+
+    @cached_property
+    def project_name_choices(self):
+        return [(project.id, f'{project.hov} {project.customer_name}') for project in self.projects]
+
+    @cached_property
+    def active_project_choices(self):
+        return [(project.id, project.hov) for project in self.projects if not project.date_deactivation]
+
+    @cached_property
+    def deactivated_project_choices(self):
+        return [(project.id, project.hov) for project in self.projects if project.date_deactivation]
+
+    @cached_property
+    def hov_choices(self):
+        return [(project.hov, project.hov) for project in self.projects]
+
+    @cached_property
+    def task_choices(self):
+        return [(task.id, task.task_name) for task in self.tasks]
+
+    @cached_property
+    def timesheet_task_choices(self):
+        return [(str(task.id), task.task_name) for task in sorted(self.tasks, key=lambda task: task.task_name)]
+
+    # (user id, username) choices, e.g. the admins that can be removed
+    def user_choices(self, role=None, without_role=None, exclude_usernames=()):
+        flags = dict(admin='is_admin', supervisor='is_supervisor')
+        return [
+            (user.id, user.username)
+            for user in self.users
+            if (role is None or getattr(user, flags[role]))
+            and (without_role is None or not getattr(user, flags[without_role]))
+            and user.username not in exclude_usernames
+        ]
+
+def load_reference_data():
+    versions = data_versions(REFERENCE_TABLES)
+    return ReferenceData(
+        versions,
+        projects=db.session.query(
+            Project.id, Project.hov, Project.customer_name, Project.date_deactivation).order_by(Project.id).all(),
+        units=db.session.query(Unit.id, Unit.project_id, Unit.pn, Unit.pn_name).order_by(Unit.id).all(),
+        tasks=db.session.query(Task.id, Task.task_name).order_by(Task.id).all(),
+        users=directory_query().all(),
+        )
+
+
+# The snapshot of one app, reloaded after a local commit to a reference table or, at most
+# every check_interval seconds, after another process changed one
+class ReferenceDataCache:
+    def __init__(self, check_interval, clock=time.monotonic):
+        self.check_interval = check_interval
+        self.clock = clock
+        self.loads = 0
+        self._data = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        data = self._data
+        if data is not None and self.clock() - self._checked < self.check_interval:
+            return data
+        with self._lock:
+            if self._data is not None and self.clock() - self._checked >= self.check_interval:
+                if data_versions(REFERENCE_TABLES) != self._data.versions:
+                    self._data = None
+                self._checked = self.clock()
+            if self._data is None:
+                self._data = load_reference_data()
+                self._checked = self.clock()
+                self.loads += 1
+            return self._data
+
+    def invalidate(self):
+        self._data = None
+
+    def stats(self):
+        return dict(
+            loaded = self._data is not None,
+            loads = self.loads,
+            check_interval = self.check_interval,
+            )
+
+def get_reference_cache():
+    return current_app.extensions['reference_data']
+
+def reference_data():
+    return get_reference_cache().get()
+
+@on_commit
+def _invalidate_reference_data(tables):
+    if has_app_context() and 'reference_data' in current_app.extensions and not tables.isdisjoint(REFERENCE_TABLES):
+        current_app.extensions['reference_data'].invalidate()
+
+def init_app(app):
+    app.extensions['reference_data'] = ReferenceDataCache(app.config['REFERENCE_DATA_CHECK_INTERVAL'])
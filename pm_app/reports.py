@@ -0,0 +1,176 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from pm_app import db
+from pm_app.database import LIKE_ESCAPE, escape_like
+from pm_app.models import (
+    User, Project, Unit, Task, WorkedFor, ProjectRollup, UnitRollup
+    )
+
+
+# Hours and cost per unit read from the unit rollups, units without any entry get 0 hours
+def unit_hours():
+    return (db.session
+            .query(
+                Unit,
+                func.coalesce(UnitRollup.total_hours, 0),
+                func.coalesce(UnitRollup.total_cost, 0),
+                )
+            .outerjoin(UnitRollup, UnitRollup.unit_id == Unit.id)
+            .order_by(Unit.id)
+            .all()
+            )
+
+# Returns the cost overview of all projects and units as plain values:
+# one query for the projects and one for the units, both read from the rollup tables
+def project_cost_overview():
+    projects = (db.session
+                .query(
+                    Project,
+                    func.coalesce(ProjectRollup.total_hours, 0),
+                    func.coalesce(ProjectRollup.total_cost, 0),
+                    )
+                .outerjoin(ProjectRollup, ProjectRollup.project_id == Project.id)
+                .order_by(Project.id)
+                .all()
+                )
+
+    overview = {}
+    budget = 0
+    cost = 0
+    for project, project_hours, project_cost in projects:
+        project_cost = round(project_cost, 3)
+        overview[project.id] = dict(
+            project=project,
+            units=[],
+            hours=project_hours,
+            cost=project_cost,
+            ratio=round(project_cost / project.budget * 100, 3) if project.budget else 0,
+        )
+        budget += project.budget
+        cost += project_cost
+
+    for unit, hours, unit_cost in unit_hours():
+        entry = overview.get(unit.project_id)
+        if entry is None:
+            continue
+        entry['units'].append(
+            dict(
+                unit=unit,
+                hours=hours,
+                cost=unit_cost,
+            )
+        )
+
+    cost = round(cost, 3)
+    revenue = round(budget - cost, 3)
+    totals = dict(
+        budget=budget,
+        cost=cost,
+        revenue=revenue,
+        ratio=round(revenue / budget * 100, 2) if budget else 0,
+    )
+
+    return dict(
+        projects=list(overview.values()),
+        totals=totals,
+    )
+
+# All time entries between start and end (dates, both included) in one joined query,
+# bucketed by day. Without user_id the entries of every user are returned.
+def entries_by_date(start, end, user_id=None):
+    query = (db.session
+             .query(
+                 WorkedFor.id,
+                 WorkedFor.date_of_work,
+                 WorkedFor.time_amount,
+                 User.username,
+                 Unit.pn,
+                 Unit.pn_name,
+                 Project.hov,
+                 Task.task_name,
+                 )
+             .join(User, User.id == WorkedFor.user_id)
+             .join(Unit, Unit.id == WorkedFor.unit_id)
+             .join(Project, Project.id == Unit.project_id)
+             .join(Task, Task.id == WorkedFor.task_id)
+             .filter(
+                 WorkedFor.date_of_work >= datetime.combine(start, datetime.min.time()),
+                 WorkedFor.date_of_work < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+                 )
+             )
+    if user_id is not None:
+        query = query.filter(WorkedFor.user_id == user_id)
+
+    entries = defaultdict(list)
+    for row in query.order_by(WorkedFor.date_of_work, WorkedFor.id):
+        entries[row.date_of_work.date()].append(
+            dict(
+                entry_id = row.id,
+                user = row.username,
+                unit = row.pn,
+                unit_name = row.pn_name,
+                project = row.hov,
+                task = row.task_name,
+                time = f'{row.time_amount} [h]',
+                )
+        )
+    return entries
+
+# One page of time entries for the entry picker, newest first, joined with their user,
+# unit, project and task. Pages are keyset paginated on the entry id: pass the id of the
+# last entry of a page as after to get the next one. Returns (entries, next cursor).
+def search_time_entries(user_id=None, username=None, project_id=None, pn=None, task_id=None,
+                        date_from=None, date_to=None, after=None, limit=25):
+    query = (db.session
+             .query(
+                 WorkedFor.id,
+                 WorkedFor.date_of_work,
+                 WorkedFor.time_amount,
+                 User.username,
+                 Unit.pn,
+                 Unit.pn_name,
+                 Project.hov,
+                 Task.task_name,
+                 )
+             .join(User, User.id == WorkedFor.user_id)
+             .join(Unit, Unit.id == WorkedFor.unit_id)
+             .join(Project, Project.id == Unit.project_id)
+             .join(Task, Task.id == WorkedFor.task_id)
+             )
+    if user_id is not None:
+        query = query.filter(WorkedFor.user_id == user_id)
+    if username:
+        query = query.filter(User.username.like(f'{escape_like(username)}%', escape=LIKE_ESCAPE))
+    if project_id is not None:
+        query = query.filter(Unit.project_id == project_id)
+    if pn:
+        query = query.filter(Unit.pn.like(f'{escape_like(pn)}%', escape=LIKE_ESCAPE))
+    if task_id is not None:
+        query = query.filter(WorkedFor.task_id == task_id)
+    if date_from is not None:
+        query = query.filter(WorkedFor.date_of_work >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.filter(WorkedFor.date_of_work < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if after is not None:
+        query = query.filter(WorkedFor.id < after)
+
+    rows = query.order_by(WorkedFor.id.desc()).limit(limit + 1).all()
+    entries = [
+        dict(
+            id = row.id,
+            label = f"{row.date_of_work.strftime('%d/%m/%Y')} {row.pn_name} {row.hov} {row.task_name} {row.time_amount} [h]",
+            date = row.date_of_work.date().isoformat(),
+            user = row.username,
+            project = row.hov,
+            unit = row.pn,
+            unit_name = row.pn_name,
+            task = row.task_name,
+            time_amount = row.time_amount,
+            )
+        for row in rows[:limit]
+    ]
+    next_cursor = entries[-1]['id'] if len(rows) > limit else None
+    return entries, next_cursor
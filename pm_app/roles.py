@@ -0,0 +1,68 @@
+from functools import wraps
+
+from flask import g, abort
+from flask_login import current_user
+
+from pm_app import db
+from pm_app.models import Admin, Supervisor
+
+
+# Roles of a user ('admin', 'supervisor'), resolved with one query and cached for the
+# rest of the request. Anonymous users have no roles.
+def get_roles(user=None):
+    user = user or current_user
+    if not user or not user.is_authenticated:
+        return frozenset()
+    cache = g.setdefault('_roles', {})
+    if user.id not in cache:
+        admin, supervisor = db.session.query(
+            db.session.query(Admin).filter(Admin.user_id == user.id).exists(),
+            db.session.query(Supervisor).filter(Supervisor.user_id == user.id).exists(),
+            ).one()
+        roles = set()
+        if admin:
+            roles.add('admin')
+        if supervisor:
+            roles.add('supervisor')
+        cache[user.id] = frozenset(roles)
+    return cache[user.id]
+
+def is_admin(user=None):
+    return 'admin' in get_roles(user)
+
+def is_supervisor(user=None):
+    return 'supervisor' in get_roles(user)
+
+# Forget the cached roles after granting or revoking one (all users without user_id)
+def invalidate_roles(user_id=None):
+    cache = g.get('_roles')
+    if not cache:
+        return
+    if user_id is None:
+        cache.clear()
+    else:
+        cache.pop(int(user_id), None)
+
+# Admins can change everything
+def admin_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not is_admin():
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+# Supervisors can see everything, so do admins
+def supervisor_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not (is_admin() or is_supervisor()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+def inject_roles():
+    return dict(is_admin=is_admin, is_supervisor=is_supervisor)
+
+def init_app(app):
+    app.context_processor(inject_roles)
@@ -0,0 +1,208 @@
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, text
+
+from pm_app import db
+from pm_app.models import (
+    Project, Unit, WorkedFor, ProjectRollup, UnitRollup
+    )
+from pm_app.versions import touch
+
+
+# Value of an attribute as it is stored in the database (before the pending change)
+def _committed(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attr)
+
+def _entry_unit_id(entry):
+    if entry.unit_id is None and entry.unit is not None:
+        return entry.unit.id
+    return int(entry.unit_id)
+
+def _rate(session, project_id):
+    project = session.query(Project).get(project_id)
+    if project is None:
+        return 0
+    return float(project.rate or 0)
+
+# Hours of a unit's rollup as SQL, 0 if it has none yet
+_UNIT_HOURS = '(SELECT COALESCE(SUM(total_hours), 0) FROM unit_rollup WHERE unit_id = :unit_id)'
+
+# Add hours (an SQL expression) to the rollup of a unit or project and price the new total at
+# rate. The sum is computed by the database, so concurrent writers add up instead of one
+# overwriting the total the other one read.
+def _add_hours(session, model, key, rate, amount=':hours', **params):
+    table = model.__tablename__
+    column = model.__table__.primary_key.columns.values()[0].name
+    session.execute(
+        text(f'INSERT INTO {table} ({column}, total_hours, total_cost) '
+             f'VALUES (:key, {amount}, {amount} * :rate) '
+             f'ON CONFLICT ({column}) DO UPDATE SET '
+             f'total_hours = {table}.total_hours + excluded.total_hours, '
+             f'total_cost = ({table}.total_hours + excluded.total_hours) * :rate'),
+        dict(params, key=key, rate=rate),
+        )
+    session.info.setdefault('rollup_tables', set()).add(table)
+
+# Add (or remove with negative hours) worked hours to the rollups of a unit and its project
+def add_unit_hours(session, unit_id, hours):
+    if not hours:
+        return
+    unit = session.query(Unit).get(unit_id)
+    if unit is None:
+        return
+    project_id = int(unit.project_id)
+    rate = _rate(session, project_id)
+    _add_hours(session, UnitRollup, unit.id, rate, hours=hours)
+    _add_hours(session, ProjectRollup, project_id, rate, hours=hours)
+
+# Move the hours of a unit from its old project to its new project
+def move_unit(session, unit_id, old_project_id, new_project_id):
+    new_rate = _rate(session, new_project_id)
+    _add_hours(session, ProjectRollup, old_project_id, _rate(session, old_project_id),
+               amount=f'-{_UNIT_HOURS}', unit_id=unit_id)
+    _add_hours(session, ProjectRollup, new_project_id, new_rate, amount=_UNIT_HOURS, unit_id=unit_id)
+    session.execute(
+        UnitRollup.__table__.update()
+        .where(UnitRollup.unit_id == unit_id)
+        .values(total_cost=UnitRollup.total_hours * new_rate)
+        )
+
+# Re-price the rollups of a project after its hourly rate changed
+def reprice_project(session, project_id):
+    rate = _rate(session, project_id)
+    session.execute(
+        ProjectRollup.__table__.update()
+        .where(ProjectRollup.project_id == project_id)
+        .values(total_cost=ProjectRollup.total_hours * rate)
+        )
+    session.execute(
+        UnitRollup.__table__.update()
+        .where(UnitRollup.unit_id.in_(session.query(Unit.id).filter(Unit.project_id == project_id).subquery()))
+        .values(total_cost=UnitRollup.total_hours * rate)
+        )
+    session.info.setdefault('rollup_tables', set()).update(
+        (ProjectRollup.__tablename__, UnitRollup.__tablename__))
+
+# The rollups are written in SQL, out of sight of the flush: expire the loaded ones, so that
+# they are read again on their next use, and bump the data versions of the written tables.
+# Callers of add_unit_hours outside a flush (Core bulk inserts) call this themselves.
+def touch_rollups(session):
+    tables = session.info.pop('rollup_tables', None)
+    if not tables:
+        return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, (ProjectRollup, UnitRollup)) and obj not in session.deleted:
+            session.expire(obj)
+    touch(session, tables)
+
+# Keep the rollups in the same transaction as the changes of WorkedFor, Unit and Project rows
+@event.listens_for(db.session, 'before_flush')
+def update_rollups(session, flush_context, instances):
+    hours = defaultdict(float)
+    moved = []
+    repriced = set()
+    removed = []
+
+    for obj in session.new:
+        if isinstance(obj, WorkedFor):
+            hours[_entry_unit_id(obj)] += float(obj.time_amount)
+
+    for obj in session.deleted:
+        if isinstance(obj, WorkedFor):
+            hours[_committed(obj, 'unit_id')] -= float(_committed(obj, 'time_amount'))
+        elif isinstance(obj, Unit):
+            removed.append((UnitRollup, obj.id))
+        elif isinstance(obj, Project):
+            removed.append((ProjectRollup, obj.id))
+
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        if isinstance(obj, WorkedFor):
+            if (state.attrs.time_amount.history.has_changes()
+                    or state.attrs.unit_id.history.has_changes()):
+                hours[_committed(obj, 'unit_id')] -= float(_committed(obj, 'time_amount'))
+                hours[_entry_unit_id(obj)] += float(obj.time_amount)
+        elif isinstance(obj, Unit):
+            if not state.attrs.project_id.history.has_changes():
+                continue
+            old_project_id = _committed(obj, 'project_id')
+            if int(obj.project_id) != old_project_id:
+                moved.append((obj.id, old_project_id, int(obj.project_id)))
+        elif isinstance(obj, Project):
+            if state.attrs.rate.history.has_changes():
+                repriced.add(obj.id)
+
+    for unit_id, old_project_id, new_project_id in moved:
+        move_unit(session, unit_id, old_project_id, new_project_id)
+    for project_id in repriced:
+        reprice_project(session, project_id)
+    for unit_id, delta in hours.items():
+        add_unit_hours(session, unit_id, delta)
+    for model, key in removed:
+        rollup = session.query(model).get(key)
+        if rollup is not None:
+            session.delete(rollup)
+
+    touch_rollups(session)
+
+# Recompute both rollup tables from WorkedFor. Returns the rows whose hours or cost
+# had drifted as (table, id, stored hours, actual hours); with dry_run nothing is written.
+def rebuild_rollups(dry_run=False, tolerance=1e-6):
+    session = db.session
+    rows = (session
+            .query(Unit.id, Unit.project_id, Project.rate, func.sum(WorkedFor.time_amount))
+            .join(WorkedFor, WorkedFor.unit_id == Unit.id)
+            .join(Project, Project.id == Unit.project_id)
+            .group_by(Unit.id)
+            .all()
+            )
+
+    unit_totals = {}
+    project_totals = defaultdict(float)
+    rates = {}
+    for unit_id, project_id, rate, hours in rows:
+        unit_totals[unit_id] = (hours, hours * (rate or 0))
+        project_totals[project_id] += hours
+        rates[project_id] = rate or 0
+    project_totals = {
+        project_id: (hours, hours * rates[project_id])
+        for project_id, hours in project_totals.items()
+    }
+
+    drift = []
+    for model, key, totals in (
+            (UnitRollup, 'unit_id', unit_totals),
+            (ProjectRollup, 'project_id', project_totals)):
+        stored = {getattr(rollup, key): rollup for rollup in session.query(model).all()}
+        for rollup_id in sorted(set(stored) | set(totals)):
+            rollup = stored.get(rollup_id)
+            stored_hours, stored_cost = (0, 0)
+            if rollup is not None:
+                stored_hours, stored_cost = rollup.total_hours, rollup.total_cost
+            hours, cost = totals.get(rollup_id, (0, 0))
+            if abs(stored_hours - hours) > tolerance or abs(stored_cost - cost) > tolerance:
+                drift.append((model.__tablename__, rollup_id, stored_hours, hours))
+            if dry_run:
+                continue
+            if rollup is None:
+                rollup = model(**{key: rollup_id})
+                session.add(rollup)
+            rollup.total_hours = hours
+            rollup.total_cost = cost
+
+    return drift
+
+# Fill the rollup tables once for databases created before they existed. Returns whether they were filled.
+def fill_rollups():
+    if ProjectRollup.query.first() is not None or WorkedFor.query.first() is None:
+        return False
+    rebuild_rollups()
+    db.session.commit()
+    return True
@@ -1,33 +1,69 @@
-import os
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta, time
 
-import secrets
-from PIL import Image
 from flask import (
-    render_template, url_for, flash, redirect, request, abort, session
+    Blueprint, render_template, url_for, flash, redirect, request, abort, session, jsonify,
+    Response, stream_with_context
     )
 from sqlalchemy.orm import query
-from pm_app import app, db, bcrypt, mail
+from pm_app import db, bcrypt, mail
 from pm_app.forms import (
     RegistrationForm, LoginForm, UpdateAccountForm, PostForm, 
     RequestResetForm, ResetPasswordForm, CreateProject, CreateUnit, 
     GetHov, GetUnit, GetTime,AddSupervisor, AddAdmin, RemoveUser, RemoveAdmin,
     RemoveSupervisor, RemoveProject, RemoveUnit, RemoveTask, CreateTask, DeactivateProject, ModifyUnit,
     ActivateProject, ChangeTimeEntry, OverviewEntry, CalendarOverview, GetUsers, ModifyRegistrationForm, 
-    GetProjects, ModifyProject, FindUnit, ChangeUnit)
+    GetProjects, ModifyProject, FindUnit, ChangeUnit, ImportTimeEntries, WeeklyTimesheet)
 from pm_app.models import (
-    User,Post, Project, Unit,db, Task , WorkedFor, Admin, Supervisor
+    User,Post, Project, Unit,db, Task , WorkedFor, Admin, Supervisor,
+    ProjectRollup, UnitRollup, invalidate_user, get_user_cache
+    )
+from pm_app.reports import (
+    project_cost_overview, entries_by_date, search_time_entries
+    )
+from pm_app.roles import (
+    is_admin, is_supervisor, invalidate_roles, admin_required, supervisor_required
+    )
+from pm_app.importer import (
+    read_rows, import_time_entries, ImportFileError
+    )
+from pm_app.pictures import PictureError, save_picture
+from pm_app.feed import post_page
+from pm_app.directory import user_directory
+from pm_app.reference import reference_data, get_reference_cache
+from pm_app.search import search_units, search_posts, UNIT_SEARCH_LIMIT, UNIT_SEARCH_MAX_LIMIT
+from pm_app.mailqueue import (
+    enqueue, queue_stats
+    )
+from pm_app.page_cache import (
+    render_cached, get_response_cache
+    )
+from pm_app.export import (
+    EXPORT_FORMATS, ExportError, export_query
+    )
+from pm_app.timesheet import (
+    TIMESHEET_DAYS, timesheet_task_choices, timesheet_unit_label, save_week
+    )
+from pm_app.datetime_ import (
+    WEEKDAYS, date_label, iso_week_label, parse_iso_week, week_monday, week_range
     )
 from flask_login import (
     login_user, current_user, logout_user, login_required
     )
 from flask_mail import Message
 
-@app.route("/")
-@app.route("/home")
+main = Blueprint('main', __name__)
+
+@main.route("/")
+@main.route("/home")
 def home():
-    page= request.args.get('page', 1, type=int)
-    posts = Post.query.order_by(Post.date_posted).paginate(per_page=5)
+    try:
+        posts = post_page(
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            newest_first=False,
+            )
+    except ValueError:
+        abort(400)
     return render_template(
         'home.html',
         title='Forum Page', 
@@ -35,66 +71,31 @@ def home():
         current_user=current_user,
         )
 
-@app.route("/about")
-def about():
-    projects = Project.query.all()
-    units = Unit.query.all()
-
-    # Create a cost per project variable
-    def cost_per_project(project_id):
-        hours = 0
-        cost = 0
-        units = Unit.query.filter_by(project_id=project_id).all()
-        # Iterate over all units of the project
-        for unit in units:
-            # Grab all hours of this unit
-            time_amount = WorkedFor.query.filter_by(unit_id=unit.id).all()
-            for t in time_amount:
-                hours += t.time_amount
-        cost = round(hours * Project.query.filter_by(id=project_id).first().rate, 3)
-        ratio = round(cost / Project.query.filter_by(id=project_id).first().budget *100, 3)
-        return [hours,cost,ratio]
-
-    def find_total_hours(unit_pn):
-        unit_s = Unit.query.filter_by(pn=unit_pn).all()
-        for unt in unit_s:
-            total_hours = 0
-            work_data = WorkedFor.query.filter_by(unit_id=unt.id).all()
-            for hour in work_data:
-                total_hours += hour.time_amount
-        return total_hours
-
-    def total_costs():
-        worked = WorkedFor.query.all()
-        projects = Project.query.all()
-        cost = 0
-        budget = 0
-        for work in worked:
-            cost += work.time_amount * Project.query.filter_by(
-                id= Unit.query.filter_by(id=work.unit_id).first().project_id
-                ).first().rate
-        for project in projects:
-            budget += project.budget
-        revenue = round(budget-cost, 3)
-        ratio = round(((revenue/budget))*100, 2)
-        return [
-            "{:,}".format(budget), 
-            "{:,}".format(cost), 
-            "{:,}".format(revenue),
-            "{:,}".format(ratio),
-            ]
-
+# Full-text search of the forum posts, best matches first, e.g. /search?q=cabin+seat
+@main.route("/search")
+def search():
+    text = request.args.get('q', '').strip()
+    try:
+        results = search_posts(text, after=request.args.get('after'))
+    except ValueError:
+        abort(400)
     return render_template(
-        'about.html', 
+        'search.html',
+        title='Search the forum',
+        search=text,
+        results=results,
+        )
+
+@main.route("/about")
+def about():
+    return render_cached(
+        'about.html',
+        (Project.__tablename__, Unit.__tablename__, ProjectRollup.__tablename__, UnitRollup.__tablename__),
+        project_cost_overview,
         title = 'Overview all projects',
-        projects = projects, 
-        units = units, 
-        find_total_hours = find_total_hours,
-        cost_per_project = cost_per_project,
-        total_costs = total_costs,
         )
 
-@app.route("/register", methods=['GET', 'POST'])
+@main.route("/register", methods=['GET', 'POST'])
 def register():
     form = RegistrationForm()
     form.supplier.choices = [("", "- Please select -")] + [(1,"Yes"),(0,"No")]
@@ -111,62 +112,52 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash('The account has been created!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template('register.html', title='Register user', form=form)
 
-@app.route("/login", methods=['GET', 'POST'])
+@main.route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and bcrypt.check_password_hash(user.password, form.password.data):
             login_user(user,remember=form.remember.data)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('home'))
+            return redirect(next_page) if next_page else redirect(url_for('main.home'))
         else:            
             flash('Login Unsuccessful. Please check email and password', 'danger')
     return render_template('login.html', title='Login', form=form)
 
-@app.route("/logout")
+@main.route("/logout")
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-def save_picture(form_picture):
-    random_hex = secrets.token_hex(8)
-    _, f_ext = os.path.splitext(form_picture.filename)
-    picture_fn = random_hex + f_ext
-    picture_path = os.path.join(app.root_path, 'static/profile_pics', picture_fn)
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
-    i.save(picture_path)
-
-    return picture_fn
-
-@app.route("/account", methods=['GET', 'POST'])
+@main.route("/account", methods=['GET', 'POST'])
 @login_required
 def account():
     form = UpdateAccountForm()
     if form.validate_on_submit():
         if form.picture.data:
-            picture_file = save_picture(form.picture.data)
-            current_user.image_file = picture_file
+            try:
+                current_user.image_file = save_picture(form.picture.data)
+            except PictureError:
+                flash('The picture could not be read, please upload a JPG or PNG image.', 'danger')
+                return redirect(url_for('main.account'))
         current_user.username = form.username.data
         current_user.email = form.email.data
         db.session.commit()
+        invalidate_user(current_user.id)
         flash('Your account has been updated!', 'success')
-        return redirect(url_for('account'))
+        return redirect(url_for('main.account'))
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.email.data = current_user.email
-    image_file = url_for('static', filename='profile_pics/' + current_user.image_file)
-    return render_template('account.html', title='Account',
-                           image_file=image_file, form=form)
+    return render_template('account.html', title='Account', form=form)
 
-@app.route('/posts/new', methods=['GET', 'POST'])
+@main.route('/posts/new', methods=['GET', 'POST'])
 @login_required
 def new_post():
     form = PostForm()
@@ -179,10 +170,10 @@ def new_post():
         db.session.add(post)
         db.session.commit()
         flash('Your post has been created!', 'success')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     return render_template('create_post.html',title='New Post', form=form)
 
-@app.route('/post/<int:post_id>')
+@main.route('/post/<int:post_id>')
 def post(post_id):
     post = Post.query.get_or_404(post_id)
     return render_template('post.html', 
@@ -190,7 +181,7 @@ def post(post_id):
                             post=post, 
                             legend='Create post')
 
-@app.route('/post/<int:post_id>/update', methods=['GET', 'POST'])
+@main.route('/post/<int:post_id>/update', methods=['GET', 'POST'])
 @login_required
 def update_post(post_id):
     post = Post.query.get_or_404(post_id)
@@ -202,7 +193,7 @@ def update_post(post_id):
         post.content = form.content.data
         db.session.commit()
         flash('Your post has been updated!', 'success')
-        return redirect(url_for('post', post_id=post.id))
+        return redirect(url_for('main.post', post_id=post.id))
     elif request.method == 'GET':
         form.title.data = post.title
         form.content.data = post.content
@@ -211,7 +202,7 @@ def update_post(post_id):
                             form=form,
                             legend='Update Post')
 
-@app.route("/post/<int:post_id>/delete", methods=['POST'])
+@main.route("/post/<int:post_id>/delete", methods=['POST'])
 @login_required
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
@@ -220,15 +211,19 @@ def delete_post(post_id):
     db.session.delete(post)
     db.session.commit()
     flash('Your post has been deleted!', 'success')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route("/usr/<string:username>")
+@main.route("/usr/<string:username>")
 def user_posts(username):
-    page= request.args.get('page', 1, type=int)
     user= User.query.filter_by(username=username).first_or_404()
-    posts = Post.query.filter_by(author=user)\
-        .order_by(Post.date_posted.desc())\
-        .paginate(per_page=5)
+    try:
+        posts = post_page(
+            user_id=user.id,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            )
+    except ValueError:
+        abort(400)
     return render_template('user_posts.html', posts=posts, user=user)
 
 def send_reset_email(user):
@@ -237,41 +232,42 @@ def send_reset_email(user):
                   sender='noreply@demo.com',
                   recipients=[user.email])
     msg.body = f'''To reset your password, visit the following link:
-{url_for('reset_token', token=token, _external=True)}
+{url_for('main.reset_token', token=token, _external=True)}
 If you did not make this request then simply ignore this email and no changes will be made.
 '''
-    mail.send(msg)
+    enqueue(msg)
 
-@app.route("/reset_password", methods=['GET', 'POST'])
+@main.route("/reset_password", methods=['GET', 'POST'])
 def reset_request():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     form = RequestResetForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         send_reset_email(user)
         flash('An email has been sent with instructions to reset your password.', 'info')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('reset_request.html', title='Reset Password', form=form)
 
-@app.route("/reset_password/<token>", methods=['GET', 'POST'])
+@main.route("/reset_password/<token>", methods=['GET', 'POST'])
 def reset_token(token):
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     user = User.verify_reset_token(token)
     if user is None:
         flash('That is an invalid or expired token', 'warning')
-        return redirect(url_for('reset_request'))
+        return redirect(url_for('main.reset_request'))
     form = ResetPasswordForm()
     if form.validate_on_submit():
         hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
         user.password = hashed_password
         db.session.commit()
+        invalidate_user(user.id)
         flash('Your password has been updated! You are now able to log in', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('reset_token.html', title='Reset Password', form=form)
 
-@app.route("/new_project", methods=['GET', 'POST'])
+@main.route("/new_project", methods=['GET', 'POST'])
 @login_required
 def create_project():
     form = CreateProject()
@@ -281,22 +277,22 @@ def create_project():
             customer_name = form.customer_name.data,
             budget = form.budget.data,
             hour_budget = form.hour_budget.data,
-            rate = form.rate.data,
+            rate = float(form.rate.data) if form.rate.data is not None else None,
             )
         db.session.add(project)
         db.session.commit()
         flash(f'Project {form.customer_name.data} ({form.hov.data}) has been created!', 'success')
-        return redirect(url_for('about'))
+        return redirect(url_for('main.about'))
     return render_template('create_project.html', title='New Project', form=form)
 
-@app.route("/new_unit", methods=['GET', 'POST'])
+@main.route("/new_unit", methods=['GET', 'POST'])
 @login_required
 def create_unit():
     form = CreateUnit()
-    projects = Project.query.all()
-    form.hov.choices = [("", "- Please select -")]+ [(project.id, project.hov) for project in projects]
+    reference = reference_data()
+    form.hov.choices = [("", "- Please select -")]+ reference.project_choices
     if form.validate_on_submit():
-        project = Project.query.filter_by(id=form.hov.data).first()
+        project = reference.project_by_id[int(form.hov.data)]
         unit = Unit(
             pn=form.pn.data, 
             pn_name=form.pn_name.data, 
@@ -305,7 +301,7 @@ def create_unit():
         db.session.add(unit)
         db.session.commit()
         flash(f'{project.hov} | Unit {form.pn_name.data} ({form.pn.data}) has been created!', 'success')
-        return redirect(url_for('about'))
+        return redirect(url_for('main.about'))
     return render_template(
         'create_unit.html', 
         title='New unit', 
@@ -313,7 +309,7 @@ def create_unit():
         )
 
 # Create Task 
-@app.route("/new_task", methods=['GET', 'POST'])
+@main.route("/new_task", methods=['GET', 'POST'])
 @login_required
 def create_task():
     form = CreateTask()
@@ -325,39 +321,43 @@ def create_task():
         db.session.add(task)
         db.session.commit()
         flash(f'Task {form.task_name.data} has been created!', 'success')
-        return redirect(url_for('about'))
+        return redirect(url_for('main.about'))
     return render_template(
         'create_task.html', 
         title='New task', 
         form=form)
 
-@app.route("/new_time_entry", methods=['GET', 'POST'])
+@main.route("/new_time_entry", methods=['GET', 'POST'])
 @login_required
 def create_time_entry():
     form = GetHov()
-    projects = Project.query.all()
-    form.hov.choices = [("", "- Please select -")]+ [(project.hov, project.hov) for project in projects]
+    form.hov.choices = [("", "- Please select -")]+ reference_data().hov_choices
     if form.validate_on_submit():
-        return redirect(url_for('get_unit', hov=request.form['hov']))
+        return redirect(url_for('main.get_unit', hov=request.form['hov']))
     return render_template(
         'create_time_entry_1.html',
         title='HoV ?',
         form=form,
         )
 
-@app.route("/new_time_entry/<string:hov>", methods=['GET', 'POST'])
+@main.route("/new_time_entry/<string:hov>", methods=['GET', 'POST'])
 @login_required
 def get_unit(hov):
     form = GetUnit()
-    project = Project.query.filter_by(hov=hov).first()
-    units = Unit.query.filter_by(project_id=project.id).all()
-    form.unit.choices = [("", "- Please select -")]+ [(unit.pn, str(unit.pn_name)+' | P/N '+str(unit.pn)) for unit in units]
+    reference = reference_data()
+    project = reference.project_by_hov.get(hov)
+    if project is None:
+        abort(404)
     if form.validate_on_submit():
+        unit = reference.unit_by_id[int(form.unit.data)]
+        if unit.project_id != project.id:
+            flash(f'Unit {unit.pn} does not belong to {project.hov}!', 'danger')
+            return redirect(url_for('main.get_unit', hov=project.hov))
         return redirect(
             url_for(
-                'get_time', 
-                unit_id=request.form['unit'],
-                hov=project)
+                'main.get_time', 
+                unit_id=unit.pn,
+                hov=project.hov)
                 )
     return render_template(
         'create_time_entry_2.html',
@@ -367,20 +367,24 @@ def get_unit(hov):
         project=project,
         )
 
-@app.route("/new_time_entry/<string:hov>/<string:unit_id>", methods=['GET', 'POST'])
+@main.route("/new_time_entry/<string:hov>/<string:unit_id>", methods=['GET', 'POST'])
 @login_required
 def get_time(unit_id, hov):
 
     form = GetTime()
     form.time_amount.choices = [("", "- Please select -")]+ [(i/10,i/10) for i in range(5,125,5)]
-    tasks = Task.query.all()
-    form.task.choices = [("", "- Please select -")]+ [(task.id, task.task_name) for task in tasks]
-    unit = Unit.query.filter_by(pn=unit_id).first()
+    reference = reference_data()
+    form.task.choices = [("", "- Please select -")]+ reference.task_choices
+    # The unit by P/N within the project of the wizard
+    project = reference.project_by_hov.get(hov)
+    unit = next((unit for unit in reference.units_by_project[project.id] if str(unit.pn) == unit_id), None) if project else None
+    if unit is None:
+        abort(404)
     if form.validate_on_submit():
         # Check if the unit_id at the day of date_of_work is unique
         if WorkedFor.query.filter_by(unit_id=unit.id, date_of_work=form.date_of_work.data).first():
             flash('Time entry already exists for this day', 'warning')
-            return redirect(url_for('create_time_entry'))
+            return redirect(url_for('main.create_time_entry'))
         time_entry = WorkedFor(
             user_id=current_user.id,
             unit_id=unit.id,
@@ -391,80 +395,215 @@ def get_time(unit_id, hov):
         flash(f'Your entry was successful for {unit.pn_name} (P/N {unit.pn}), {form.time_amount.data} [h], {form.date_of_work.data}', 'success')
         db.session.add(time_entry)
         db.session.commit()
-        return redirect(url_for('about'))
+        return redirect(url_for('main.about'))
     return render_template(
         'create_time_entry_3.html',
         title='Time ?',
         form=form,
-        hov=hov,
+        hov=project,
         unit_id=unit_id,
         unit=unit
         )
 
+# Units for the unit autocomplete of the forms, best matches first, e.g.
+# /units/search?q=g1f&project=1&active=1&limit=20
+@main.route("/units/search", methods=['GET'])
+@login_required
+def search_unit():
+    limit = max(1, min(request.args.get('limit', UNIT_SEARCH_LIMIT, type=int), UNIT_SEARCH_MAX_LIMIT))
+    units = search_units(
+        request.args.get('q'),
+        project_id=request.args.get('project', type=int),
+        active=bool(request.args.get('active', type=int)),
+        limit=limit,
+        )
+    return jsonify(units=units)
+
+# Weekly timesheet, e.g. /timesheet/?week=2026-W40: a whole week of time entries on one page,
+# validated against the existing entries with one query and written in one commit
+@main.route("/timesheet/", methods=['GET', 'POST'])
+@login_required
+def timesheet():
+    try:
+        monday = parse_iso_week(request.args['week']) if request.args.get('week') else week_monday(date.today())
+    except ValueError as error:
+        flash(str(error), 'warning')
+        monday = week_monday(date.today())
+    week = iso_week_label(monday)
+    days = [monday + timedelta(days=n) for n in range(TIMESHEET_DAYS)]
+
+    form = WeeklyTimesheet()
+    task_choices = timesheet_task_choices()
+    for row in form.rows:
+        row.task.choices = task_choices
+
+    if form.validate_on_submit():
+        cells = []
+        incomplete = False
+        for row in form.rows:
+            hours = [(day, float(field.data)) for day, field in zip(days, row.hours) if field.data]
+            if not hours:
+                continue
+            if not row.unit.data or not row.task.data:
+                incomplete = True
+                continue
+            cells += [(int(row.unit.data), int(row.task.data), day, amount) for day, amount in hours]
+
+        if incomplete:
+            flash('Every row with hours needs a unit and a task!', 'danger')
+        elif not cells:
+            flash('There are no hours to save!', 'warning')
+        else:
+            conflicts = save_week(current_user.id, monday, cells)
+            if not conflicts:
+                flash(f'{len(cells)} time entries have been saved for week {week}!', 'success')
+                return redirect(url_for('main.timesheet', week=week))
+            for unit_id, day, reason in conflicts:
+                flash(f'{timesheet_unit_label(unit_id) or unit_id} on {date_label(day)}: {reason}', 'danger')
+
+    return render_template(
+        'timesheet.html',
+        title='Weekly timesheet',
+        form=form,
+        unit_labels=[timesheet_unit_label(row.unit.data) for row in form.rows],
+        week=week,
+        days=[(WEEKDAYS[day.weekday()], date_label(day), day) for day in days],
+        entries=entries_by_date(days[0], days[-1], current_user.id),
+        previous_week=iso_week_label(monday - timedelta(weeks=1)),
+        next_week=iso_week_label(monday + timedelta(weeks=1)),
+        )
+
 # Change time entry - get the worked_for id, delete the entry and redirect to the create_time_entry page
-@app.route("/change_time_entry/", methods=['GET', 'POST'])
+@main.route("/change_time_entry/", methods=['GET', 'POST'])
 @login_required
 def change_time_entry():
     form = ChangeTimeEntry()
-    if current_user.username == 'admin':
-        entries = WorkedFor.query.all()
-    else:
-        entries = WorkedFor.query.filter_by(user_id=current_user.id)
-    form.entries.choices = [("", "- Please select -")]+ [(
-        entry.id, str(
-            Unit.query.filter_by(id=entry.unit_id).first().pn_name + " " + 
-            Project.query.filter_by(id=Unit.query.filter_by(id=entry.unit_id).first().project_id).first().hov + " " + 
-            Task.query.filter_by(id=entry.task_id).first().task_name + " " +str(entry.time_amount) + " [h] ")
-            ) for entry in entries]
     if form.validate_on_submit():
-        entry = WorkedFor.query.filter_by(id=form.entries.data).first()
+        entry = WorkedFor.query.get(form.entry_id.data)
+        if entry is None or (entry.user_id != current_user.id and not is_admin()):
+            flash('This time entry does not exist or belongs to someone else!', 'danger')
+            return redirect(url_for('main.change_time_entry'))
+        unit = entry.unit
+        project = Project.query.get(unit.project_id)
         db.session.delete(entry)
         db.session.commit()
-        flash(f'Entry {Unit.query.filter_by(id=entry.unit_id).first().pn_name + " " + Project.query.filter_by(id=Unit.query.filter_by(id=entry.unit_id).first().project_id).first().hov + " "} has been deleted!', 'success')
-        return redirect(url_for('create_time_entry'))
+        flash(f'Entry {unit.pn_name + " " + project.hov + " "} has been deleted!', 'success')
+        return redirect(url_for('main.create_time_entry'))
     return render_template(
         'change_time_entry.html',
         title='Change time entry',
         form=form,
+        projects=sorted(reference_data().projects, key=lambda project: project.hov),
+        tasks=sorted(reference_data().tasks, key=lambda task: task.task_name),
+        show_user_filter=is_admin(),
+        )
+
+# Search the time entries for the picker of change_time_entry, e.g.
+# /change_time_entry/search?project=1&date_from=2021-01-01&after=1234
+# Admins search all entries, everybody else only their own.
+TIME_ENTRY_PAGE_SIZE = 25
+TIME_ENTRY_MAX_PAGE_SIZE = 100
+
+@main.route("/change_time_entry/search", methods=['GET'])
+@login_required
+def search_time_entry():
+    args = request.args
+    try:
+        date_from = date.fromisoformat(args['date_from']) if args.get('date_from') else None
+        date_to = date.fromisoformat(args['date_to']) if args.get('date_to') else None
+    except ValueError:
+        return jsonify(error='Dates must be given as YYYY-MM-DD'), 400
+    limit = max(1, min(args.get('limit', TIME_ENTRY_PAGE_SIZE, type=int), TIME_ENTRY_MAX_PAGE_SIZE))
+
+    entries, next_cursor = search_time_entries(
+        user_id=None if is_admin() else current_user.id,
+        username=args.get('user') if is_admin() else None,
+        project_id=args.get('project', type=int),
+        pn=args.get('unit'),
+        task_id=args.get('task', type=int),
+        date_from=date_from,
+        date_to=date_to,
+        after=args.get('after', type=int),
+        limit=limit,
+        )
+    return jsonify(entries=entries, next=next_cursor)
+
+# Export the time entries for finance, e.g.
+# /export/time_entries?format=parquet&project=1&date_from=2021-01-01&date_to=2021-12-31
+# The file is streamed while it is written, so memory stays flat for any number of rows.
+@main.route("/export/time_entries", methods=['GET'])
+@login_required
+@supervisor_required
+def export_time_entries():
+    args = request.args
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown format, use one of {', '.join(EXPORT_FORMATS)}"), 400
+    try:
+        date_from = date.fromisoformat(args['date_from']) if args.get('date_from') else None
+        date_to = date.fromisoformat(args['date_to']) if args.get('date_to') else None
+    except ValueError:
+        return jsonify(error='Dates must be given as YYYY-MM-DD'), 400
+
+    mimetype, chunks = EXPORT_FORMATS[export_format]
+    query = export_query(date_from, date_to, args.get('project', type=int))
+    try:
+        body = chunks(query)
+    except ExportError as error:
+        return jsonify(error=str(error)), 501
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=time_entries.{export_format}'},
         )
 
 # Create a base route for admins
-@app.route("/admin/")
+@main.route("/admin/")
 @login_required
 def admin():
-    user = Admin.query.filter_by(user_id=current_user.id).first()
-    if user:
+    if is_admin():
         return render_template(
             'admin.html', 
             title='Admin',
-            user=user,
             current_user=current_user,
             )
     else:
         flash('This area is reserved for admins only! ','danger')
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
+
+# Cache statistics of this worker, e.g. to check the hit ratio under load
+@main.route("/admin/metrics/")
+@login_required
+@admin_required
+def metrics():
+    return jsonify(
+        user_cache = get_user_cache().stats(),
+        response_cache = get_response_cache().stats(),
+        reference_data = get_reference_cache().stats(),
+        mail_queue = queue_stats(),
+        )
 
 # Create a route to add a user to supervisor
-@app.route("/admin/<string:username>/add_supervisor/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/add_supervisor/", methods=['GET', 'POST'])
 @login_required
 def add_supervisor(username):
     form = AddSupervisor()
-    users = User.query.all()
-    form.supervisor.choices = [("", "- Please select -")]+ [(user.id, user.username) for user in users]
+    form.supervisor.choices = [("", "- Please select -")]+ reference_data().user_choices(without_role='supervisor')
     if form.validate_on_submit():
         user_id = form.supervisor.data
         id = User.query.filter_by(id=user_id).first()
         if Supervisor.query.filter_by(user_id=user_id).first():
             flash(f'User {id.username} is already supervisor!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         else:
             supervisor = Supervisor(
                 user_id=id.id,
                 )
             db.session.add(supervisor)
             db.session.commit()
+            invalidate_roles(id.id)
             flash(f'User {id.username} has been added!', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
     return render_template(
         'add_supervisor.html', 
         title='Add User',
@@ -472,26 +611,26 @@ def add_supervisor(username):
         )
 
 # Create a route to add a user to admin
-@app.route("/admin/<string:username>/add_admin/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/add_admin/", methods=['GET', 'POST'])
 @login_required
 def add_admin(username):
     form = AddAdmin()
-    users = User.query.all()
-    form.admin.choices = [("", "- Please select -")]+ [(user.id, user.username) for user in users]
+    form.admin.choices = [("", "- Please select -")]+ reference_data().user_choices(without_role='admin')
     if form.validate_on_submit():
         user_id = form.admin.data
         id = User.query.filter_by(id=user_id).first()
         if Admin.query.filter_by(user_id=user_id).first():
             flash(f'User {id.username} is already admin!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         else:
             admin = Admin(
                 user_id=id.id,
                 )
             db.session.add(admin)
             db.session.commit()
+            invalidate_roles(id.id)
             flash(f'User {id.username} has been added!', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
     return render_template(
         'add_admin.html', 
         title='Add User',
@@ -499,19 +638,18 @@ def add_admin(username):
         )
 
 # Remove user  
-@app.route("/admin/<string:username>/remove_user/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/remove_user/", methods=['GET', 'POST'])
 @login_required
 def remove_user(username):
     form = RemoveUser()
-    users = User.query.all()
-    form.user.choices = [("", "- Please select -")]+ [(user.id, user.username) for user in users if not user.username == 'admin']
+    form.user.choices = [("", "- Please select -")]+ reference_data().user_choices(exclude_usernames=('admin',))
     if form.validate_on_submit():
         # Add check if user is already in WorkedFor
         user_id = form.user.data
         id = User.query.filter_by(id=user_id).first()
         if id.username == 'admin':
             flash(f'{id.username} cannot be removed!', 'danger')
-            return redirect(url_for('remove_user',username=current_user))
+            return redirect(url_for('main.remove_user',username=current_user))
         if id:
             user = User.query.filter_by(id=user_id).first()
             admin = Admin.query.filter_by(user_id=user_id).first()
@@ -523,9 +661,11 @@ def remove_user(username):
             if supervisor:
                 db.session.delete(supervisor)
             db.session.commit()
+            invalidate_roles(user_id)
+            invalidate_user(user_id)
 
             flash(f'User {id.username} has been removed!', 'success')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
     return render_template(
         'remove_from_db.html',
         title='Remove User',
@@ -533,23 +673,23 @@ def remove_user(username):
         )
 
 # Remove user from admin
-@app.route("/admin/<string:username>/remove_admin/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/remove_admin/", methods=['GET', 'POST'])
 @login_required
 def remove_admin(username):
     form = RemoveAdmin()
-    admins = Admin.query.all()
-    form.user.choices = [("", "- Please select -")]+ [(admin.id, User.query.filter_by(id=admin.user_id).first().username) for admin in admins if not User.query.filter_by(id=admin.user_id).first().username == 'admin']
+    form.user.choices = [("", "- Please select -")]+ reference_data().user_choices(role='admin', exclude_usernames=('admin',))
     if form.validate_on_submit():
         user = User.query.filter_by(id=form.user.data).first()
         admin = Admin.query.filter_by(user_id=user.id).first()
         if user.username == 'admin':
             flash(f'{user.username} cannot be removed!', 'danger')
-            return redirect(url_for('remove_admin',username=current_user))
+            return redirect(url_for('main.remove_admin',username=current_user))
         db.session.delete(admin)
         db.session.commit()
+        invalidate_roles(user.id)
             
         flash(f'User {user.username} has been removed!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'remove_from_db.html',
         title='Remove Admin',
@@ -557,110 +697,99 @@ def remove_admin(username):
         )
 
 # Remove user from supervisor
-@app.route("/admin/<string:username>/remove_supervisor/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/remove_supervisor/", methods=['GET', 'POST'])
 @login_required
 def remove_supervisor(username):
     form = RemoveSupervisor()
-    supervisors = Supervisor.query.all()
-    form.user.choices = [("", "- Please select -")]+ [(supervisor.id, User.query.filter_by(id=supervisor.user_id).first().username) for supervisor in supervisors]
+    form.user.choices = [("", "- Please select -")]+ reference_data().user_choices(role='supervisor')
     if form.validate_on_submit():
         user = User.query.filter_by(id=form.user.data).first()
         supervisor = Supervisor.query.filter_by(user_id=user.id).first()
 
         db.session.delete(supervisor)
         db.session.commit()
+        invalidate_roles(user.id)
             
         flash(f'User {user.username} has been removed!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'remove_from_db.html',
         title='Remove Supervisor',
         form=form,
         )
 
-# Overview of all users
-@app.route("/admin/<string:username>/users/", methods=['GET', 'POST'])
+# Overview of all users, with their roles. Searchable by username or email with ?q=
+@main.route("/admin/<string:username>/users/", methods=['GET', 'POST'])
 @login_required
 def overview_users(username):
-    users = User.query.all()
-    kind = 'users'
-    return render_template(
-        'overview_users.html',
-        title=f'Overview {kind.capitalize()}',
-        kind=kind,
-        infos=users,
-        )
+    return _overview_directory('users')
 
 # Overview of all supervisors
-@app.route("/admin/<string:username>/supervisors/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/supervisors/", methods=['GET', 'POST'])
 @login_required
 def overview_supervisors(username):
-    users = [usr.id for usr in User.query.all() for spr in Supervisor.query.all() if usr.id == spr.user_id ]
-    users = [name for name in User.query.all() if name.id in users]
-    kind = 'supervisors'
-    return render_template(
-        'overview_supervisors.html',
-        title=f'Overview {kind.capitalize()}',
-        kind=kind,
-        infos=users,
-        )
+    return _overview_directory('supervisors', role='supervisor')
 
 # Overview of all admins
-@app.route("/admin/<string:username>/admins/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/admins/", methods=['GET', 'POST'])
 @login_required
 def overview_admins(username):
-    users = [usr.id for usr in User.query.all() for adm in Admin.query.all() if usr.id == adm.user_id ]
-    users = [name for name in User.query.all() if name.id in users]
-    kind = 'admins'
-    return render_template(
-        'overview_admins.html',
+    return _overview_directory('admins', role='admin')
+
+def _overview_directory(kind, role=None):
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    return render_cached(
+        'overview_users.html',
+        (User.__tablename__, Admin.__tablename__, Supervisor.__tablename__),
+        lambda: dict(directory=user_directory(search, role, page)),
         title=f'Overview {kind.capitalize()}',
         kind=kind,
-        infos=users,
+        search=search,
         )
 
 # Overview of all units
-@app.route("/admin/<string:username>/units/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/units/", methods=['GET', 'POST'])
 @login_required
 def overview_units(username):
-    units = Unit.query.all()
     kind = 'units'
-    return render_template(
+    return render_cached(
         'overview_units.html',
+        (Unit.__tablename__,),
+        lambda: dict(infos=Unit.query.all()),
         title=f'Overview {kind.capitalize()}',
         kind=kind,
-        infos=units,
         )
 
 # Overview of all tasks
-@app.route("/admin/<string:username>/tasks/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/tasks/", methods=['GET', 'POST'])
 @login_required
 def overview_tasks(username):
-    tasks = Task.query.all()
     kind = 'tasks'
-    return render_template(
+    return render_cached(
         'overview_tasks.html',
+        (Task.__tablename__,),
+        lambda: dict(infos=Task.query.all()),
         title=f'Overview {kind.capitalize()}',
         kind=kind,
-        infos=tasks,
         )
 
 # Delete project 
-@app.route("/admin/<string:username>/delete_project/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/delete_project/", methods=['GET', 'POST'])
 @login_required
 def delete_project(username):
     form = RemoveProject()
-    form.project.choices = [("", "- Please select -")]+ [(project.id, project.hov) for project in Project.query.all()]
+    form.project.choices = [("", "- Please select -")]+ reference_data().project_choices
     if form.validate_on_submit():
         project = Project.query.filter_by(id=form.project.data).first()
         unit = Unit.query.filter_by(project_id=form.project.data).first()
         if unit:
             flash(f'Project {project.hov} cannot be deleted, because it is not empty!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         db.session.delete(project)
         db.session.commit()
         flash(f'Project {form.project.data} has been deleted!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'remove_project.html',
         title='Delete Project',
@@ -668,21 +797,20 @@ def delete_project(username):
         )
 
 # Delete a unit
-@app.route("/admin/<string:username>/delete_unit/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/delete_unit/", methods=['GET', 'POST'])
 @login_required
 def delete_unit(username):
     form = RemoveUnit()
-    form.unit.choices = [("", "- Please select -")]+ [(unit.id, unit.pn) for unit in Unit.query.all()]
     if form.validate_on_submit():
         unit = Unit.query.filter_by(id=form.unit.data).first()
         worked = WorkedFor.query.filter_by(unit_id=form.unit.data).all()
         if worked:
             flash(f'Unit {unit.pn} cannot be deleted, employees have already worked for that!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         db.session.delete(unit)
         db.session.commit()
         flash(f'Unit {unit.pn_name} has been deleted!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'remove_unit.html',
         title='Delete Unit',
@@ -690,46 +818,78 @@ def delete_unit(username):
         )
 
 # Delete a task
-@app.route("/admin/<string:username>/delete_task/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/delete_task/", methods=['GET', 'POST'])
 @login_required
 def delete_task(username):
     form = RemoveTask()
-    form.task.choices = [("", "- Please select -")]+ [(task.id, task.task_name) for task in Task.query.all()]
+    form.task.choices = [("", "- Please select -")]+ reference_data().task_choices
     if form.validate_on_submit():
         task = Task.query.filter_by(id=form.task.data).first()
         worked = WorkedFor.query.filter_by(task_id=form.task.data).all()
         if worked:
             flash(f'Task {task.task_name} cannot be deleted, employees have already worked for that!', 'danger')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
         db.session.delete(task)
         db.session.commit()
         flash(f'Task {form.task.data} has been deleted!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'remove_task.html',
         title='Delete Task',
         form=form,
         )
 
+# Import time entries from a CSV or Excel file, invalid rows are skipped and listed
+IMPORT_MAX_SHOWN_ERRORS = 200
+
+@main.route("/admin/<string:username>/import_time_entries/", methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_entries(username):
+    form = ImportTimeEntries()
+    imported = None
+    errors = []
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            imported, errors = import_time_entries(read_rows(upload.stream, upload.filename))
+        except ImportFileError as error:
+            db.session.rollback()
+            flash(f'The file could not be read: {error}', 'danger')
+            return redirect(url_for('main.import_entries', username=current_user))
+        flash(
+            f'{imported} time entries have been imported, {len(errors)} row(s) skipped!',
+            'success' if not errors else 'warning',
+            )
+    return render_template(
+        'import_time_entries.html',
+        title='Import time entries',
+        form=form,
+        imported=imported,
+        errors=errors[:IMPORT_MAX_SHOWN_ERRORS],
+        error_count=len(errors),
+        )
+
 # Deactivate a project
-@app.route("/admin/<string:username>/deactivate_project/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/deactivate_project/", methods=['GET', 'POST'])
 @login_required
 def deactivate_project(username):
     form = DeactivateProject()
-    if Project.query.filter(Project.date_deactivation == None).all():
-        form.project.choices = [("", "- Please select -")]+ [(project.id, project.hov) for project in Project.query.filter(Project.date_deactivation == None).all()]
+    active = reference_data().active_project_choices
+    if active:
+        form.project.choices = [("", "- Please select -")]+ active
     else:
         form.project.choices = [('','- No project deactivated -')]
     if form.validate_on_submit():
         project = Project.query.filter_by(id=form.project.data).first()
         if project.date_deactivation:
             flash(f'Project {project.hov} is already deactivated!', 'danger')
-            return redirect(url_for('deactivate_project',username=current_user))
+            return redirect(url_for('main.deactivate_project',username=current_user))
         else:
             project.date_deactivation = datetime.utcnow()
             db.session.commit()
             flash(f'Project {project.hov} has been deactivated!', 'success')
-            return redirect(url_for('admin'))     
+            return redirect(url_for('main.admin'))     
     return render_template(
         'activate_deactivate_project.html',
         title='Deactivate Project',
@@ -737,25 +897,26 @@ def deactivate_project(username):
         )
 
 # Activate a project
-@app.route("/admin/<string:username>/reactivate_project/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/reactivate_project/", methods=['GET', 'POST'])
 @login_required
 def reactivate_project(username):
     form = ActivateProject()
     # Query all projects that are deactivated
-    if Project.query.filter(Project.date_deactivation != None).all():
-        form.project.choices = [("", "- Please select -")]+ [(project.id, project.hov) for project in Project.query.filter(Project.date_deactivation != None).all()]
+    deactivated = reference_data().deactivated_project_choices
+    if deactivated:
+        form.project.choices = [("", "- Please select -")]+ deactivated
     else:
         form.project.choices = [('','- No project deactivated -')]
     if form.validate_on_submit():
         project = Project.query.filter_by(id=form.project.data).first()
         if not project.date_deactivation:
             flash(f'Project {project.hov} is not deactivated!', 'danger')
-            return redirect(url_for('reactivate_project',username=current_user))
+            return redirect(url_for('main.reactivate_project',username=current_user))
         else:
             project.date_deactivation = None
             db.session.commit()
             flash(f'Project {project.hov} has been activated!', 'success')
-            return redirect(url_for('admin'))     
+            return redirect(url_for('main.admin'))     
     return render_template(
         'activate_deactivate_project.html',
         title='Activate Project',
@@ -763,60 +924,61 @@ def reactivate_project(username):
         )
 
 # Show active vs. deactived projects using about.html template
-@app.route("/admin/<string:username>/show_project_status/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/show_project_status/", methods=['GET', 'POST'])
 @login_required
 def show_project_status(username):
-    projects = Project.query.all()
-    active_projects = [project for project in projects if not project.date_deactivation]
-    deactivated_projects = [project for project in projects if project.date_deactivation]
-    return render_template(
+    def build():
+        projects = Project.query.all()
+        return dict(
+            active_projects=[project for project in projects if not project.date_deactivation],
+            deactivated_projects=[project for project in projects if project.date_deactivation],
+            )
+    return render_cached(
         'overview_project_status.html',
+        (Project.__tablename__,),
+        build,
         title='Status overview projects',
-        active_projects=active_projects,
-        deactivated_projects=deactivated_projects,
         )
 
 # Modify project_id of a unit
-@app.route("/admin/<string:username>/modify_unit/", methods=['GET', 'POST'])
+@main.route("/admin/<string:username>/modify_unit/", methods=['GET', 'POST'])
 @login_required
 def modify_unit(username):
     form = ModifyUnit()
-    form.unit.choices = [("", "- Please select -")]+ [(unit.id, f'{unit.pn} in {Project.query.filter_by(id=unit.project_id).first().hov}') for unit in Unit.query.all()]
-    form.project.choices = [("", "- Please select -")]+ [(project.id, project.hov) for project in Project.query.all()]
-
-    def get_project_name(unit_id):
-        project = Project.query.filter_by(id=unit_id).first()
-        return project.hov
+    reference = reference_data()
+    form.project.choices = [("", "- Please select -")]+ reference.project_choices
 
     if form.validate_on_submit():
         unit = Unit.query.filter_by(id=form.unit.data).first()
-        project_old = Project.query.filter_by(id=unit.project_id).first()
+        if unit is None:
+            flash('This unit does not exist anymore!', 'danger')
+            return redirect(url_for('main.modify_unit',username=current_user))
+        # The unit is a live row, its project may be newer than the reference data
+        project_old = reference.project_by_id.get(unit.project_id) or Project.query.get(unit.project_id)
 
-        project_new = Project.query.filter_by(id=form.project.data).first()
+        project_new = reference.project_by_id[int(form.project.data)]
 
         if unit.project_id == project_new.id:
             flash(f'Unit {unit.pn} already belongs to project {project_old.hov}!', 'danger')
-            return redirect(url_for('modify_unit',username=current_user))
+            return redirect(url_for('main.modify_unit',username=current_user))
         unit.project_id = form.project.data
         db.session.commit()
         flash(f'Unit {unit.pn} has been modified from {project_old.hov} to {project_new.hov}', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     return render_template(
         'modify_unit.html',
         title='Modify Unit',
         form=form,
-        get_project_name=get_project_name,
         )
 
 # Modify a user, fist get user, than modify user
-@app.route("/admin/get_user/", methods=['GET', 'POST'])
+@main.route("/admin/get_user/", methods=['GET', 'POST'])
 @login_required
 def get_user():
     form = GetUsers()
-    users = User.query.all()
-    form.users.choices = [("", "- Please select -")]+ [(user.id, user.username) for user in users]
+    form.users.choices = [("", "- Please select -")]+ reference_data().user_choices()
     if form.validate_on_submit():
-        return redirect(url_for('modify_user',user_id=form.users.data))
+        return redirect(url_for('main.modify_user',user_id=form.users.data))
     return render_template(
         'change_user.html',
         title = 'User to be modified',
@@ -824,21 +986,21 @@ def get_user():
     )
 
 # Modify the user from previous 
-@app.route("/admin/<int:user_id>/modify_user/", methods=['GET', 'POST'])
+@main.route("/admin/<int:user_id>/modify_user/", methods=['GET', 'POST'])
 @login_required
+@admin_required
 def modify_user(user_id):
     user = User.query.get_or_404(user_id)
     form = ModifyRegistrationForm()
-    if not Admin.query.filter_by(user_id=current_user.id).first():
-        abort(403)
     if form.validate_on_submit():
         user.username = form.username.data
         user.email = form.email.data
         if form.password.data:
             user.password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
         db.session.commit()
+        invalidate_user(user.id)
         flash(f'User {user.username} has been modified!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     elif request.method == 'GET':
         # form.supplier.choices = [("", "- Please select -")] + [(1,"Yes"),(0,"No")]
         form.username.data = user.username
@@ -850,14 +1012,13 @@ def modify_user(user_id):
         )
 
 # Modify a project, fist get project, than modify project
-@app.route("/admin/get_project/", methods=['GET', 'POST'])
+@main.route("/admin/get_project/", methods=['GET', 'POST'])
 @login_required
 def get_project():
     form = GetProjects()
-    projects = Project.query.all()
-    form.projects.choices = [("", "- Please select -")]+ [(project.id, f'{project.hov} {project.customer_name}') for project in projects]
+    form.projects.choices = [("", "- Please select -")]+ reference_data().project_name_choices
     if form.validate_on_submit():
-        return redirect(url_for('modify_project',project_id=form.projects.data))
+        return redirect(url_for('main.modify_project',project_id=form.projects.data))
     return render_template(
         'change_project.html',
         title = 'Project to be modified',
@@ -865,22 +1026,21 @@ def get_project():
     )
 
 # Modify project 
-@app.route("/admin/<int:project_id>/modify_project/", methods=['GET', 'POST'])
+@main.route("/admin/<int:project_id>/modify_project/", methods=['GET', 'POST'])
 @login_required
+@admin_required
 def modify_project(project_id):
     project = Project.query.get_or_404(project_id)
     form = ModifyProject()
-    if not Admin.query.filter_by(user_id=current_user.id).first():
-        abort(403)
     if form.validate_on_submit():
         project.hov = form.hov.data 
         project.customer_name = form.customer_name.data
         project.budget = form.budget.data
         project.hour_budget = form.hour_budget.data
-        project.rate = form.rate.data
+        project.rate = float(form.rate.data) if form.rate.data is not None else None
         db.session.commit()
         flash(f'Project {form.customer_name.data} ({form.hov.data}) has been modified!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     elif request.method == 'GET':
         form.hov.data = project.hov
         form.customer_name.data  = project.customer_name
@@ -891,14 +1051,12 @@ def modify_project(project_id):
 
 
 # Modify a unit, fist get unit, than modify unit
-@app.route("/admin/find_unit/", methods=['GET', 'POST'])
+@main.route("/admin/find_unit/", methods=['GET', 'POST'])
 @login_required
 def find_unit():
     form = FindUnit()
-    units = Unit.query.all()
-    form.units.choices = [("", "- Please select -")]+ [(unit.id, f'{unit.pn_name} ({unit.pn})') for unit in units]
     if form.validate_on_submit():
-        return redirect(url_for('change_unit',unit_id=form.units.data))
+        return redirect(url_for('main.change_unit',unit_id=form.units.data))
     return render_template(
         'change_unit.html',
         subtitle = 'Units',
@@ -907,32 +1065,66 @@ def find_unit():
     )
 
 # Modify unit 
-@app.route("/admin/<int:unit_id>/change_unit/", methods=['GET', 'POST'])
+@main.route("/admin/<int:unit_id>/change_unit/", methods=['GET', 'POST'])
 @login_required
+@admin_required
 def change_unit(unit_id):
     unit = Unit.query.get_or_404(unit_id)
     form = ChangeUnit()
-    if not Admin.query.filter_by(user_id=current_user.id).first():
-        abort(403)
     if form.validate_on_submit():
         unit.pn_name = form.pn_name.data 
         unit.pn = form.pn.data
         unit.project_id = form.hov.data
         db.session.commit()
         flash(f'Unit {form.pn.data} ({form.pn_name.data}) has been modified!', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     elif request.method == 'GET':
         form.pn_name.data = unit.pn_name
         form.pn.data  = unit.pn
-        projects = Project.query.all()
-        form.hov.choices  =[("", "- Please select -")]+ [(project.id,f'{project.hov} ({project.customer_name})') for project in projects]  
+        form.hov.choices  =[("", "- Please select -")]+ reference_data().project_customer_choices
     return render_template(
         'create_unit.html', 
         title='Modify Unit', 
         form=form)
 
+# Number of weeks shown around the requested week when the calendar is opened
+CALENDAR_WEEKS_BEFORE = 2
+CALENDAR_WEEKS_AFTER = 2
+# Weeks fetched per scroll step and upper bound of weeks returned by one call of calendar_weeks
+CALENDAR_LOAD_WEEKS = 4
+CALENDAR_MAX_WEEKS = 12
+
+# Admins and supervisors see the entries of everyone, users only their own
+def calendar_user_id():
+    if is_admin() or is_supervisor():
+        return None
+    return current_user.id
+
+# Build count weeks (Monday to Friday) starting at monday, with all their entries fetched at once
+def calendar_weeks_data(monday, count, days_per_week=5):
+    weeks = [
+        dict(
+            week = label,
+            cw = days[0][0].isocalendar()[1],
+            days = [
+                dict(date = date_label, date_obj = day)
+                for day, date_label in days[:days_per_week]
+                ],
+            )
+        for label, days in week_range(monday, count)
+    ]
+    entries = entries_by_date(
+        weeks[0]['days'][0]['date_obj'],
+        weeks[-1]['days'][-1]['date_obj'],
+        user_id=calendar_user_id(),
+        )
+    for week in weeks:
+        for day in week['days']:
+            day['entries'] = entries.get(day['date_obj'], [])
+    return weeks
+
 # Calender Overview
-@app.route("/calendar/", methods=['GET', 'POST'])
+@main.route("/calendar/", methods=['GET', 'POST'])
 @login_required
 def calendar_overview():
     form = CalendarOverview()
@@ -941,90 +1133,59 @@ def calendar_overview():
         'Thursday','Friday',#'Saturday',#'Sunday',
         ]
 
-    # Query all Users, Units, Projects and Tasks.     
-    def query_per_date(date_obj,user=None):
-        # Query all WorkedFor entries with date_obj date
-        if Admin.query.filter_by(user_id=current_user.id).first():
-            worked = WorkedFor.query.filter_by(date_of_work=date_obj).all()
-        elif Supervisor.query.filter_by(user_id=current_user.id).first():
-            worked = WorkedFor.query.filter_by(date_of_work=date_obj).all()
+    # The window is centered on ?week=YYYY-Www, starts at ?year=YYYY or is centered on today
+    try:
+        if request.args.get('week'):
+            anchor = parse_iso_week(request.args['week'])
+        elif request.args.get('year'):
+            anchor = parse_iso_week(f"{request.args['year']}-W01") + timedelta(weeks=CALENDAR_WEEKS_BEFORE)
         else:
-            worked = WorkedFor.query.filter(WorkedFor.date_of_work == date_obj, WorkedFor.user_id == current_user.id).all()
-            
-        entry_list = []
-        for entry in worked:
-            # Query all Users, Units, Projects and Tasks. 
-            entry_list.append(
-                dict(
-                    entry_id = entry.id,
-                    user = User.query.filter_by(id=entry.user_id).first().username,
-                    unit = Unit.query.filter_by(id=entry.unit_id).first().pn,
-                    unit_name = Unit.query.filter_by(id=entry.unit_id).first().pn_name,
-                    project = Project.query.filter_by(id=Unit.query.filter_by(id=entry.unit_id).first().project_id).first().hov,
-                    task = Task.query.filter_by(id=entry.task_id).first().task_name,
-                    time = f'{entry.time_amount} [h]',
-                    )
-            )
+            anchor = week_monday(date.today())
+    except ValueError as error:
+        flash(str(error), 'warning')
+        anchor = week_monday(date.today())
 
-        return entry_list
-
-    # Returns a dictionary as follows: key = date and values = [weekday , week number]
-    def year_data(year=None):
-
-        if year is None:
-            date = datetime.now()
-            year = date.strftime("%Y")
-
-        # Create placeholders boundary days of year 
-        day_one_obj = datetime(int(year), 1, 1)
-        day_last_obj = datetime(int(year), 12, 31)
-
-        # Create placeholder for the date of the day one's week
-        DayOneOfFirstDayWeek_obj = day_one_obj - timedelta(days = day_one_obj.weekday())
-
-        # Create placeholder for the date of the day last's week
-        DayLastOfLastDayWeek_obj = day_last_obj + timedelta(days = 6 - day_last_obj.weekday())
-
-        # Create a nested dictionary with the week of the year as key and the correponding dates and weekdays as values. 
-        calender = {
-            (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%d/%m/%Y"):
-            {
-                int(
-                    (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%V")
-                    )+1:
-                (DayOneOfFirstDayWeek_obj + timedelta(days=day)).strftime("%A"),
-            }
-            for day in range(
-                0, (
-                    DayLastOfLastDayWeek_obj - DayOneOfFirstDayWeek_obj).days + 1
-                )
-            }
-        
-        return calender
-            
-    def convert_dt_obj(string):
-        date = dict(
-            cw = int(datetime.strptime(string , "%d/%m/%Y").strftime("%V")),
-            day = datetime.strptime(string , "%d/%m/%Y").strftime("%d"),
-            month = datetime.strptime(string , "%d/%m/%Y").strftime("%m"),
-            year = datetime.strptime(string , "%d/%m/%Y").strftime("%Y"),
-            date = datetime.strptime(string , "%d/%m/%Y").strftime("%d/%m/%Y"),
-            date_obj = datetime.strptime(string , "%d/%m/%Y")
-        )
-        return date
+    first = week_monday(anchor) - timedelta(weeks=CALENDAR_WEEKS_BEFORE)
+    weeks = calendar_weeks_data(first, CALENDAR_WEEKS_BEFORE + 1 + CALENDAR_WEEKS_AFTER, len(weekdays) - 1)
 
     return render_template(
         'calendar.html',
         title = 'Calendar Overview',
         form = form,
         weekdays = weekdays,
-        year_data = year_data,
-        convert_dt_obj = convert_dt_obj,
-        query_per_date = query_per_date,
+        weeks = weeks,
+        load_weeks = CALENDAR_LOAD_WEEKS,
+        previous_week = iso_week_label(first - timedelta(weeks=CALENDAR_LOAD_WEEKS)),
+        next_week = iso_week_label(first + timedelta(weeks=len(weeks))),
+        )
+
+# Entries of a range of weeks as JSON, e.g. /calendar/weeks?from=2026-W40&count=4
+@main.route("/calendar/weeks", methods=['GET'])
+@login_required
+def calendar_weeks():
+    try:
+        monday = parse_iso_week(request.args.get('from', ''))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    count = request.args.get('count', CALENDAR_LOAD_WEEKS, type=int)
+    count = max(1, min(count, CALENDAR_MAX_WEEKS))
+
+    weeks = calendar_weeks_data(monday, count)
+    for week in weeks:
+        for day in week['days']:
+            day['iso'] = day.pop('date_obj').isoformat()
+            for entry in day['entries']:
+                entry['url'] = url_for('main.overview_entry', entry_id=entry['entry_id'])
+
+    # previous/next are the starts of the adjacent ranges of the same size
+    return jsonify(
+        weeks = weeks,
+        previous = iso_week_label(monday - timedelta(weeks=count)),
+        next = iso_week_label(monday + timedelta(weeks=count)),
         )
 
 # Summary Overview Time Entry from Calendar
-@app.route("/calendar/<int:entry_id>/", methods=['GET'])
+@main.route("/calendar/<int:entry_id>/", methods=['GET'])
 @login_required
 def overview_entry(entry_id):
     form = OverviewEntry()
@@ -1041,7 +1202,7 @@ def overview_entry(entry_id):
         worked.time_amount = form.time_amount.data
         db.session.commit()
         flash(f'Time entry for {user.username} has been modified!', 'success')
-        return redirect(url_for('calendar_overview'))
+        return redirect(url_for('main.calendar_overview'))
 
     return render_template(
         'overview_entry.html',
@@ -0,0 +1,186 @@
+from markupsafe import Markup
+from sqlalchemy import and_, func, literal_column, or_, tuple_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql import table, column
+
+from pm_app import db
+from pm_app.database import LIKE_ESCAPE, escape_like
+from pm_app.feed import POSTS_PER_PAGE
+from pm_app.models import Project, Unit, Post
+
+# Full-text search on the SQLite FTS5 tables created by the migrations, unit_search for the
+# unit autocomplete and post_search for the forum. A query is split into terms that must all
+# match. For units every term is a prefix, e.g. "g1f 1101" finds the unit G1F with P/N
+# 1101000-020, for posts a term is a whole word up to its English stem ("brackets" finds
+# "bracket"). Results are ranked with bm25: matches in the P/N of a unit weigh the most, in a
+# post the title weighs more than the content. The FTS5 tables only exist on SQLite, other
+# databases fall back to case-insensitive substring matches without ranking.
+UNIT_SEARCH_LIMIT = 20
+UNIT_SEARCH_MAX_LIMIT = 100
+# bm25 weights of the columns pn, pn_name and hov of unit_search
+UNIT_SEARCH_WEIGHTS = (10.0, 2.0, 1.0)
+
+# Every matching post is ranked, a page costs a few microseconds per match: about 6 ms for a
+# word in 1,000 of a million posts, 100 ms for one in 50,000 (benchmarks/post_search.py).
+
+# Length in words of the content snippet of a found post
+POST_SNIPPET_WORDS = 32
+# Marks around the matched words, replaced by <mark> tags once the text is escaped
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'
+
+unit_search = table('unit_search', column('rowid'), column('unit_search'))
+post_search = table('post_search', column('rowid'), column('post_search'), column('rank'))
+
+
+# Whether the database has the FTS5 tables of the migrations, i.e. is SQLite
+def full_text_search():
+    return db.engine.dialect.name == 'sqlite'
+
+# Condition that every term of text occurs in one of columns, e.g. for databases without FTS5.
+# None if text has no terms.
+def contains_terms(text, *columns):
+    terms = (text or '').split()
+    if not terms:
+        return None
+    return and_(*(
+        or_(*(column.ilike(f'%{escape_like(term)}%', escape=LIKE_ESCAPE) for column in columns))
+        for term in terms
+    ))
+
+# FTS5 query of the terms in text, every term quoted so that its punctuation is not read as
+# query syntax. None if text has no terms.
+def match_expression(text, prefix=True):
+    terms = [term.replace('"', '""') for term in (text or '').split()]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term in terms)
+
+# The best limit units for the autocomplete, optionally only units of one project or of active
+# projects. Without a text the units are listed by HoV and P/N.
+def search_units(text=None, project_id=None, active=False, limit=UNIT_SEARCH_LIMIT):
+    query = (db.session
+             .query(Unit.id, Unit.pn, Unit.pn_name, Unit.project_id, Project.hov)
+             .join(Project, Project.id == Unit.project_id)
+             )
+    if project_id is not None:
+        query = query.filter(Unit.project_id == project_id)
+    if active:
+        query = query.filter(Project.date_deactivation == None)
+    expression = match_expression(text)
+    if expression is None:
+        query = query.order_by(Project.hov, Unit.pn)
+    elif not full_text_search():
+        query = (query
+                 .filter(contains_terms(text, Unit.pn, Unit.pn_name, Project.hov))
+                 .order_by(Project.hov, Unit.pn)
+                 )
+    else:
+        query = (query
+                 .join(unit_search, unit_search.c.rowid == Unit.id)
+                 .filter(unit_search.c.unit_search.match(expression))
+                 .order_by(func.bm25(literal_column('unit_search'), *UNIT_SEARCH_WEIGHTS), Unit.pn)
+                 )
+    return [
+        dict(
+            id = row.id,
+            pn = row.pn,
+            name = row.pn_name,
+            project_id = row.project_id,
+            hov = row.hov,
+            label = f'{row.pn_name} | P/N {row.pn} | {row.hov}',
+            )
+        for row in query.limit(limit)
+    ]
+
+# One page of found posts, each a dict of the post with its author and the highlighted title
+# and snippet. Pass next_cursor as after to get the next page.
+class PostSearchPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+def highlight(text):
+    return (Markup.escape(text or '')
+            .replace(HIGHLIGHT_START, Markup('<mark>'))
+            .replace(HIGHLIGHT_END, Markup('</mark>')))
+
+# The cursor of a found post is its rank (a float, written exactly with repr) and its id
+def encode_search_cursor(rank, post_id):
+    return f'{rank!r}_{post_id}'
+
+# Raises ValueError for a cursor that was not made by encode_search_cursor
+def decode_search_cursor(cursor):
+    rank, post_id = cursor.split('_')
+    return float(rank), int(post_id)
+
+# Posts matching text, best first. Every matching post is ranked, pages are keyset paginated
+# on (rank, id) and read at most per_page + 1 rows after the cursor. The found posts are then
+# loaded with their authors in one query, so that the ranking only sorts ids.
+def search_posts(text, after=None, per_page=POSTS_PER_PAGE):
+    expression = match_expression(text, prefix=False)
+    if expression is None:
+        return PostSearchPage([], None)
+    if not full_text_search():
+        return _search_posts_unranked(text, after, per_page)
+    position = decode_search_cursor(after) if after else None
+    rank = post_search.c.rank
+    query = (db.session
+             .query(
+                 post_search.c.rowid,
+                 rank,
+                 func.highlight(literal_column('post_search'), 0, HIGHLIGHT_START, HIGHLIGHT_END),
+                 func.snippet(literal_column('post_search'), 1, HIGHLIGHT_START, HIGHLIGHT_END, '…',
+                              POST_SNIPPET_WORDS),
+                 )
+             .filter(post_search.c.post_search.match(expression))
+             )
+    if position is not None:
+        query = query.filter(tuple_(rank, post_search.c.rowid) > tuple_(*position))
+    rows = query.order_by(rank, post_search.c.rowid).limit(per_page + 1).all()
+
+    found = rows[:per_page]
+    posts = {}
+    if found:
+        posts = {
+            post.id: post
+            for post in Post.query.options(joinedload(Post.author)).filter(Post.id.in_([row[0] for row in found]))
+        }
+    items = [
+        dict(
+            post = posts[post_id],
+            title = highlight(title),
+            snippet = highlight(snippet),
+            )
+        for post_id, _, title, snippet in found
+    ]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_search_cursor(found[-1][1], found[-1][0])
+    return PostSearchPage(items, next_cursor)
+
+def _snippet(content, words=POST_SNIPPET_WORDS):
+    content = (content or '').split()
+    return ' '.join(content[:words]) + (' …' if len(content) > words else '')
+
+# search_posts without the FTS5 index: the newest posts containing every term in the title or
+# the content, keyset paginated on the id. The cursor keeps the format of ranked pages.
+def _search_posts_unranked(text, after, per_page):
+    query = Post.query.options(joinedload(Post.author)).filter(contains_terms(text, Post.title, Post.content))
+    if after:
+        _, post_id = decode_search_cursor(after)
+        query = query.filter(Post.id < post_id)
+    posts = query.order_by(Post.id.desc()).limit(per_page + 1).all()
+
+    found = posts[:per_page]
+    items = [
+        dict(
+            post = post,
+            title = highlight(post.title),
+            snippet = highlight(_snippet(post.content)),
+            )
+        for post in found
+    ]
+    next_cursor = None
+    if len(posts) > per_page:
+        next_cursor = encode_search_cursor(0.0, found[-1].id)
+    return PostSearchPage(items, next_cursor)
@@ -0,0 +1,67 @@
+// Windowed calendar: loads further weeks from /calendar/weeks when the user scrolls
+// to the end of the table or presses one of the load buttons.
+(function () {
+  var body = document.getElementById('calendar-weeks');
+  var previous = document.getElementById('calendar-previous');
+  var next = document.getElementById('calendar-next');
+  var count = parseInt(body.dataset.count, 10);
+  var loading = false;
+
+  function cell(children, header) {
+    var td = document.createElement('td');
+    td.className = 'text-center';
+    var strong = document.createElement('strong');
+    strong.textContent = header;
+    td.appendChild(strong);
+    children.forEach(function (child) { td.appendChild(child); });
+    return td;
+  }
+
+  function weekRow(week) {
+    var tr = document.createElement('tr');
+    tr.dataset.week = week.week;
+    tr.appendChild(cell([], week.cw));
+    week.days.forEach(function (day) {
+      var links = day.entries.map(function (entry) {
+        var a = document.createElement('a');
+        a.href = entry.url;
+        var p = document.createElement('p');
+        p.className = 'text-center';
+        p.textContent = entry.project + ' | ' + entry.unit_name + ' | ' + entry.time;
+        a.appendChild(p);
+        return a;
+      });
+      tr.appendChild(cell(links, day.date));
+    });
+    return tr;
+  }
+
+  function load(button, before) {
+    if (loading) { return; }
+    loading = true;
+    var url = body.dataset.url + '?from=' + encodeURIComponent(button.dataset.week) + '&count=' + count;
+    fetch(url, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        var rows = data.weeks.map(weekRow);
+        if (before) {
+          var first = body.firstChild;
+          rows.forEach(function (row) { body.insertBefore(row, first); });
+          previous.dataset.week = data.previous;
+        } else {
+          rows.forEach(function (row) { body.appendChild(row); });
+          next.dataset.week = data.next;
+        }
+      })
+      .finally(function () { loading = false; });
+  }
+
+  previous.addEventListener('click', function () { load(previous, true); });
+  next.addEventListener('click', function () { load(next, false); });
+
+  if ('IntersectionObserver' in window) {
+    new IntersectionObserver(function (items) {
+      if (items[0].isIntersecting) { load(next, false); }
+    }).observe(next);
+  }
+})();
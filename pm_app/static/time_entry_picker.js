@@ -0,0 +1,43 @@
+// Entry picker of change_time_entry: searches /change_time_entry/search page by page
+// and writes the selected entry id into the hidden entry_id field of the delete form.
+(function () {
+  var search = document.getElementById('entry-search');
+  var results = document.getElementById('entry-results');
+  var more = document.getElementById('entry-more');
+  var selected = document.getElementById('entry_id');
+  var params = null;
+  var cursor = null;
+
+  function load(reset) {
+    var query = new URLSearchParams(params);
+    if (!reset && cursor !== null) { query.set('after', cursor); }
+    fetch(search.dataset.url + '?' + query.toString(), {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        if (reset) { results.innerHTML = ''; }
+        (data.entries || []).forEach(function (entry) {
+          var option = document.createElement('option');
+          option.value = entry.id;
+          option.textContent = entry.user + ' | ' + entry.label;
+          results.appendChild(option);
+        });
+        cursor = data.next;
+        more.hidden = cursor === null || cursor === undefined;
+      });
+  }
+
+  search.addEventListener('submit', function (event) {
+    event.preventDefault();
+    params = new URLSearchParams();
+    new FormData(search).forEach(function (value, key) {
+      if (value) { params.set(key, value); }
+    });
+    cursor = null;
+    load(true);
+  });
+  more.addEventListener('click', function () { load(false); });
+  results.addEventListener('change', function () { selected.value = results.value; });
+
+  params = new URLSearchParams();
+  load(true);
+})();
@@ -0,0 +1,40 @@
+// Unit autocomplete of the _unit_picker.html macro: asks /units/search for the best matches
+// while the user types and writes the id of the selected unit into the hidden form field.
+(function () {
+  document.querySelectorAll('.unit-picker').forEach(function (picker) {
+    var field = document.getElementById(picker.dataset.field);
+    var input = document.getElementById(picker.dataset.field + '-search');
+    var results = document.getElementById(picker.dataset.field + '-results');
+    var timer = null;
+    var latest = 0;
+
+    function load() {
+      var query = new URLSearchParams();
+      if (input.value.trim()) { query.set('q', input.value.trim()); }
+      if (picker.dataset.project) { query.set('project', picker.dataset.project); }
+      if (picker.dataset.active) { query.set('active', picker.dataset.active); }
+      var request = ++latest;
+      fetch(picker.dataset.url + '?' + query.toString(), {credentials: 'same-origin'})
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          // An answer to an older search arriving late is dropped
+          if (request !== latest) { return; }
+          results.innerHTML = '';
+          (data.units || []).forEach(function (unit) {
+            var option = document.createElement('option');
+            option.value = unit.id;
+            option.textContent = unit.label;
+            option.selected = String(unit.id) === field.value;
+            results.appendChild(option);
+          });
+        });
+    }
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(load, 150);
+    });
+    results.addEventListener('change', function () { field.value = results.value; });
+    load();
+  });
+})();
@@ -0,0 +1,171 @@
+import random
+from itertools import accumulate
+from datetime import date, datetime, timedelta
+
+from pm_app import db, bcrypt
+from pm_app.models import User, Supervisor, Admin, Post, Project, Unit, Task, WorkedFor
+from pm_app.rollups import rebuild_rollups
+from pm_app.versions import touch
+
+# Synthetic data at realistic volumes, e.g. for the benchmarks. The same seed and volumes
+# always give the same rows. Everything is written with bulk inserts in one transaction and
+# named with SYNTHETIC_PREFIX, so it sits next to the demo data of seed_database.
+SYNTHETIC_PREFIX = 'syn'
+SYNTHETIC_PASSWORD = 'password'
+# Rows per executemany
+SYNTHETIC_BATCH_SIZE = 10000
+
+CUSTOMERS = (
+    'Swiss International Air Lines', 'Deutsche Lufthansa', 'Austrian Airlines', 'Brussels Airlines',
+    'Edelweiss Air', 'Eurowings', 'Helvetic Airways', 'Air Dolomiti',
+    )
+TASKS = (
+    'Project admin', '2D drawings', '3D models', 'ILR', 'STP', 'STR', 'FWR', 'CRs',
+    'Stress analysis', 'Certification', 'Testing', 'Customer support',
+    )
+HOURS = [n / 2 for n in range(1, 17)]
+# Made-up words of the posts, drawn with Zipf's law like the words of real text so that the
+# full-text search sees common and rare terms
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ber', 'dan', 'fel', 'gor', 'hul', 'jin', 'pes', 'wak')
+WORDS = (
+    tuple(a + b for a in SYLLABLES for b in SYLLABLES)
+    + tuple(a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES)
+    )
+WORD_WEIGHTS = list(accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+class SyntheticDataError(Exception):
+    pass
+
+def _insert(table, rows, batch_size=SYNTHETIC_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+
+# Ids of the rows just inserted, in insertion order
+def _ids(model, condition):
+    return [row_id for row_id, in db.session.query(model.id).filter(condition).order_by(model.id)]
+
+# Weekdays (Monday to Friday) of the years before until, oldest first
+def _workdays(years, until):
+    day = until - timedelta(days=365 * years - 1)
+    days = []
+    while day <= until:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+# Add users (a tenth of them supervisors, one admin), projects with their units, tasks, posts
+# and time entries spread evenly over the workdays of the last years before until. Like in
+# the app there is at most one entry per unit and day. Returns the number of rows per table.
+def generate(users=500, projects=300, units=10000, tasks=12, entries=5000000, posts=1000,
+             years=4, until=date(2025, 12, 31), seed=0, batch_size=SYNTHETIC_BATCH_SIZE, progress=None):
+    progress = progress or (lambda table, count: None)
+    if db.session.query(Project.query.filter(Project.hov.like(SYNTHETIC_PREFIX.upper() + '%')).exists()).scalar():
+        raise SyntheticDataError('The database already contains synthetic data')
+    if min(users, projects, units, tasks) < 1:
+        raise SyntheticDataError('At least one user, project, unit and task is needed')
+    days = _workdays(years, until)
+    if entries > len(days) * units:
+        raise SyntheticDataError(
+            f'{entries} entries do not fit into {units} units on {len(days)} workdays (one entry per unit and day)')
+    rng = random.Random(seed)
+
+    password = bcrypt.generate_password_hash(SYNTHETIC_PASSWORD).decode('utf-8')
+    _insert(User.__table__, (
+        dict(
+            username=f'{SYNTHETIC_PREFIX}{n:06d}',
+            email=f'{SYNTHETIC_PREFIX}{n:06d}@example.com',
+            image_file='default.jpg',
+            password=password,
+            supplier=rng.randint(0, 3),
+            )
+        for n in range(users)
+    ), batch_size)
+    user_ids = _ids(User, User.username.like(SYNTHETIC_PREFIX + '%'))
+    _insert(Supervisor.__table__, [dict(user_id=user_id) for user_id in user_ids[1::10]], batch_size)
+    _insert(Admin.__table__, [dict(user_id=user_ids[0])], batch_size)
+    progress(User.__tablename__, users)
+
+    start = datetime.combine(days[0], datetime.min.time())
+    span = (until - days[0]).days + 1
+    _insert(Project.__table__, (
+        dict(
+            hov=f'{SYNTHETIC_PREFIX.upper()}{n:05d}',
+            customer_name=rng.choice(CUSTOMERS),
+            budget=float(rng.randrange(50000, 2000000, 10000)),
+            hour_budget=float(rng.randrange(500, 20000, 100)) if rng.random() < 0.5 else None,
+            rate=float(rng.choice((100, 110, 120, 135, 150))),
+            date_created=start + timedelta(days=rng.randrange(span)),
+            date_deactivation=datetime.combine(until, datetime.min.time()) if rng.random() < 0.1 else None,
+            )
+        for n in range(projects)
+    ), batch_size)
+    project_ids = _ids(Project, Project.hov.like(SYNTHETIC_PREFIX.upper() + '%'))
+    progress(Project.__tablename__, projects)
+
+    # Every project gets at least one unit, the rest are spread at random
+    unit_projects = project_ids[:units] + [rng.choice(project_ids) for _ in range(units - len(project_ids))]
+    unit_projects.sort()
+    _insert(Unit.__table__, (
+        dict(project_id=project_id, pn=f'{9000000 + n}-{n % 1000:03d}', pn_name=f'{SYNTHETIC_PREFIX.upper()}-G{n}')
+        for n, project_id in enumerate(unit_projects)
+    ), batch_size)
+    unit_ids = _ids(Unit, Unit.pn_name.like(SYNTHETIC_PREFIX.upper() + '-%'))
+    progress(Unit.__tablename__, units)
+
+    _insert(Task.__table__, (
+        dict(task_name=f'{TASKS[n % len(TASKS)]} ({SYNTHETIC_PREFIX})', task_description=f'Synthetic task {n}')
+        for n in range(tasks)
+    ), batch_size)
+    task_ids = _ids(Task, Task.task_name.like(f'% ({SYNTHETIC_PREFIX})'))
+    progress(Task.__tablename__, tasks)
+
+    def words(count):
+        return ' '.join(rng.choices(WORDS, cum_weights=WORD_WEIGHTS, k=count))
+    _insert(Post.__table__, (
+        dict(
+            title=f'{words(3).capitalize()} ({n})',
+            date_posted=start + timedelta(seconds=rng.randrange(span * 86400)),
+            content=words(rng.randint(10, 60)),
+            user_id=rng.choice(user_ids),
+            )
+        for n in range(posts)
+    ), batch_size)
+    progress(Post.__tablename__, posts)
+
+    # The same number of entries on every workday, each day on different units
+    def time_entries():
+        per_day, extra = divmod(entries, len(days))
+        for number, day in enumerate(days):
+            date_of_work = datetime.combine(day, datetime.min.time())
+            for unit_id in rng.sample(unit_ids, per_day + (number < extra)):
+                yield dict(
+                    user_id=rng.choice(user_ids),
+                    unit_id=unit_id,
+                    task_id=rng.choice(task_ids),
+                    time_amount=rng.choice(HOURS),
+                    date_of_work=date_of_work,
+                    )
+    _insert(WorkedFor.__table__, time_entries(), batch_size)
+    progress(WorkedFor.__tablename__, entries)
+
+    # Bulk inserts bypass the ORM, so the rollups and data versions are updated here
+    rebuild_rollups()
+    touch(db.session, [model.__tablename__ for model in (User, Supervisor, Admin, Post, Project, Unit, Task, WorkedFor)])
+    db.session.commit()
+
+    return {
+        User.__tablename__: users,
+        Project.__tablename__: projects,
+        Unit.__tablename__: units,
+        Task.__tablename__: tasks,
+        Post.__tablename__: posts,
+        WorkedFor.__tablename__: entries,
+    }
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from pm_app import db
+from pm_app.models import WorkedFor
+from pm_app.reference import reference_data
+
+# The timesheet covers the working days of a week, like the calendar
+TIMESHEET_DAYS = 5
+
+
+# Task choices of the timesheet from the reference data. Units are picked with the unit
+# autocomplete, a select with every unit in each row would be far too large.
+def timesheet_task_choices():
+    return [("", "- Task -")] + reference_data().timesheet_task_choices
+
+# 'HoV | name | P/N' of a unit id (int or submitted string), None for no or an unknown unit
+def timesheet_unit_label(unit_id):
+    reference = reference_data()
+    unit = reference.unit_by_id.get(int(unit_id)) if str(unit_id or '').isdigit() else None
+    if unit is None:
+        return None
+    project = reference.project_by_id.get(unit.project_id)
+    return f'{project.hov if project else unit.project_id} | {unit.pn_name} | P/N {unit.pn}'
+
+# (unit_id, day) pairs of the given units that already have an entry in the week, in one range query
+def booked_days(unit_ids, monday, days=TIMESHEET_DAYS):
+    if not unit_ids:
+        return set()
+    start = datetime.combine(monday, datetime.min.time())
+    rows = (db.session
+            .query(WorkedFor.unit_id, WorkedFor.date_of_work)
+            .filter(
+                WorkedFor.unit_id.in_(unit_ids),
+                WorkedFor.date_of_work >= start,
+                WorkedFor.date_of_work < start + timedelta(days=days),
+                )
+            )
+    return {(unit_id, day.date()) for unit_id, day in rows}
+
+# Write the cells of a week as (unit_id, task_id, day, hours). A unit can only be booked once per
+# day, so the cells are first checked against each other and the existing entries. Returns the
+# conflicts as (unit_id, day, reason); the entries are only written, in one commit, without any.
+def save_week(user_id, monday, cells):
+    conflicts = []
+    seen = set()
+    booked = booked_days({unit_id for unit_id, _, _, _ in cells}, monday)
+    for unit_id, _, day, _ in cells:
+        if (unit_id, day) in booked:
+            conflicts.append((unit_id, day, 'time entry already exists for this day'))
+        elif (unit_id, day) in seen:
+            conflicts.append((unit_id, day, 'unit is booked twice on this day'))
+        seen.add((unit_id, day))
+    if conflicts:
+        return conflicts
+
+    db.session.add_all([
+        WorkedFor(
+            user_id=user_id,
+            unit_id=unit_id,
+            task_id=task_id,
+            time_amount=hours,
+            date_of_work=datetime.combine(day, datetime.min.time()),
+            )
+        for unit_id, task_id, day, hours in cells
+    ])
+    db.session.commit()
+    return []
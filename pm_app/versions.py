@@ -0,0 +1,83 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, request, make_response
+from sqlalchemy import event, text
+
+from pm_app import db
+from pm_app.models import DataVersion
+
+
+# Bump the version of the given tables, in the transaction of the session
+def touch(session, tables):
+    session.info.setdefault('touched_tables', set()).update(tables)
+    for table_name in sorted(tables):
+        session.execute(
+            text('INSERT INTO data_version (table_name, version) VALUES (:table_name, 1) '
+                 'ON CONFLICT (table_name) DO UPDATE SET version = data_version.version + 1'),
+            dict(table_name=table_name),
+            )
+
+# Every flush bumps the versions of the tables it wrote to. Core statements bypass this
+# event and have to call touch themselves (see pm_app.importer).
+@event.listens_for(db.session, 'after_flush')
+def bump_data_versions(session, flush_context):
+    tables = set()
+    for obj in list(session.new) + list(session.deleted):
+        tables.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            tables.add(obj.__table__.name)
+    tables.discard(DataVersion.__tablename__)
+    if tables:
+        touch(session, tables)
+
+# Functions called with the set of written tables after every commit that bumped a version,
+# e.g. to drop an in-process cache of these tables
+_commit_listeners = []
+
+def on_commit(listener):
+    _commit_listeners.append(listener)
+    return listener
+
+@event.listens_for(db.session, 'after_commit')
+def notify_commit_listeners(session):
+    tables = session.info.pop('touched_tables', None)
+    if tables:
+        for listener in _commit_listeners:
+            listener(tables)
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_touched_tables(session):
+    session.info.pop('touched_tables', None)
+
+# Current versions of the given tables, tables that never changed are at version 0
+def data_versions(tables):
+    versions = dict.fromkeys(tables, 0)
+    rows = db.session.query(DataVersion.table_name, DataVersion.version).filter(
+        DataVersion.table_name.in_(versions))
+    versions.update(rows)
+    return versions
+
+# ETag of a request whose response only depends on the given tables
+def data_etag(tables):
+    versions = data_versions(tables)
+    key = request.full_path + '|' + ','.join(f'{name}:{versions[name]}' for name in sorted(versions))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+# Conditional GET for views that only read the given tables: the ETag is derived from their
+# versions, so a client sending a matching If-None-Match gets a 304 before the view runs.
+def conditional(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            etag = data_etag(tables)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapped
+    return decorator
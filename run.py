@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
-from pm_app import app
+from pm_app import create_app
+
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)